@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path, UploadFile
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Path, UploadFile, Response, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from typing import List,Optional 
@@ -7,9 +8,19 @@ import uuid
 import aiofiles
 import json
 
-from .services import BooksFondsService
-
-from ....core import get_db, MEDIA_DIR, MAX_FILE_SIZE
+from .services import BooksFondsService, ID_CHUNK, author_index, genre_index
+from .importer import BookImporter, attach_covers, detect_format, read_rows
+from .exporter import EXPORT_FORMATS, export_catalog, export_format
+from .jobs import import_jobs
+from ..exhibitions.services import SnapshotService
+
+from ....core import get_db, get_read_db, MEDIA_DIR, MAX_FILE_SIZE
+from ....core.database import db_helper
+from ....core.config import settings
+from ....core.response_cache import cached_json, invalidate_on_commit
+from ....core.conditional import is_not_modified, not_modified, touch
+from ....core.serialization import JSONBytesResponse, dump_lines, dump_rows
+from ....core import media
 from ....models import (
     Book,
     Author,
@@ -22,12 +33,24 @@ from .schemas import (
     GenreResponse,
     BookPut,
     AuthorCreate, 
-    GenreCreate
+    GenreCreate,
+    ImportReport,
+    CoverResult,
 )
 
 
 router_library = APIRouter()
 
+BOOKS_PAGE_SIZE = 50
+
+
+def _book_tags(book: BookResponse) -> List[str]:
+    return [
+        f"book:{book.id}",
+        *(f"author:{author.id}" for author in book.authors),
+        *(f"genre:{genre.id}" for genre in book.genres),
+    ]
+
 
 # Эндпоинты для работы с книгами
 @router_library.get("/books/", response_model=List[BookResponse])
@@ -36,10 +59,61 @@ async def get_all_books(
     genre_id: Optional[List[int]] = Query(None),
     sort_order: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Значение X-Next-Cursor прошлой страницы"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Размер страницы"),
+    db: AsyncSession = Depends(get_read_db),
 ):
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
-    return await service.get_filtered_books(author_id, genre_id, sort_order, search)
+    # Без cursor/limit - весь каталог, как раньше
+    paged = cursor is not None or limit is not None
+    cards, next_cursor = await service.get_book_cards(
+        author_id, genre_id, sort_order, search, cursor, (limit or BOOKS_PAGE_SIZE) if paged else None
+    )
+    # Строки Core сразу в байты: без проверки response_model на каждую книгу
+    response = JSONBytesResponse(dump_rows(cards))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@router_library.get("/books/stream/", response_class=StreamingResponse)
+async def stream_all_books(
+    author_id: Optional[List[int]] = Query(None),
+    genre_id: Optional[List[int]] = Query(None),
+    sort_order: Optional[str] = Query(None),
+    search: Optional[str] = Query(None),
+):
+    """Каталог в формате NDJSON: одна книга (BookResponse) на строку."""
+
+    async def lines():
+        # Своя сессия: get_read_db закрывается до того, как начнётся отдача тела
+        async with db_helper.read_session_factory() as db:
+            service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
+            async for cards in service.stream_books(author_id, genre_id, sort_order, search):
+                yield dump_lines(cards)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router_library.get("/books/export/", response_class=StreamingResponse)
+async def export_books(
+    format: str = Query("csv", pattern="^(csv|ndjson|jsonl)$"),
+    chunk_size: int = Query(ID_CHUNK, ge=1, le=ID_CHUNK, description="Книг на пачку"),
+):
+    """Весь каталог файлом CSV или NDJSON; совместим с /books/import/."""
+    fmt = export_format(format)
+
+    async def body():
+        # Своя сессия: get_read_db закрывается до того, как начнётся отдача тела
+        async with db_helper.read_session_factory() as db:
+            async for part in export_catalog(db, fmt, chunk_size):
+                yield part
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="catalog.{fmt}"'},
+    )
 
 
 import logging
@@ -50,47 +124,17 @@ import aiofiles.os
 
 logger = logging.getLogger(__name__)
 
-async def _delete_old_image(image_url: Optional[str]) -> None:
+async def _delete_old_image(db: AsyncSession, image_url: Optional[str]) -> None:
     """
-    Удаляет старый файл изображения, если он существует.
-    Путь к файлу определяется с помощью MEDIA_DIR.
+    Освобождает старое изображение: файл удаляется после COMMIT,
+    если на него больше не ссылается ни одна книга или выставка.
     """
-    if not image_url:
-        return
-
-    try:
-        # Предполагается, что image_url хранит относительный путь от MEDIA_DIR
-        filepath = MEDIA_DIR / Pathh(image_url).name
-
-        if await aiofiles.os.path.exists(filepath):
-            if await aiofiles.os.path.isfile(filepath):
-                await aiofiles.os.remove(filepath)
-                logger.info(f"Deleted old image: {filepath}")
-            else:
-                logger.warning(f"Path is not a file: {filepath}")
-        else:
-            logger.info(f"File not found: {filepath}")
-
-    except Exception as e:
-        logger.error(f"Error deleting file {image_url}: {str(e)}")
+    await media.release(db, image_url)
 
 
 async def _save_image(image: UploadFile) -> str:
-    """
-    Сохраняет изображение в каталоге MEDIA_DIR.
-    Если каталоги не существуют, создаёт их.
-    """
-    # Убедимся, что MEDIA_DIR существует; если нет, создаем его с родительскими директориями
-    MEDIA_DIR.mkdir(parents=True, exist_ok=True)
-
-    filename = f"{uuid.uuid4()}{Pathh(image.filename).suffix}"
-    filepath = MEDIA_DIR / filename
-
-    async with aiofiles.open(filepath, "wb") as buffer:
-        content = await image.read()
-        await buffer.write(content)
-
-    return filename
+    """Сохраняет изображение под SHA-256 содержимого (повторы не копируются)."""
+    return await media.store_upload(image)
 
 
 @router_library.put("/books/{book_id}", response_model=BookResponse)
@@ -99,19 +143,20 @@ async def put_book(
     book_data: BookPut = Depends(BookPut.as_form),
     db: AsyncSession = Depends(get_db)
 ):
-    finded_book = await db.execute(select(Book).where(Book.id == book_id))
-    book = finded_book.scalar_one_or_none()
+    # Авторы и жанры нужны и для замены коллекций, и для ответа
+    service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
+    book = await service.get_book(book_id)
     if not book:
         raise HTTPException(404, "book not found") 
     
     # Check if a new image is provided
     if book_data.image_url is not None:
-        # Delete the old image if it exists
-        if book.image_url:
-            await _delete_old_image(book.image_url)
+        old_image_url = book.image_url
         # Save the new image
         filename = await _save_image(book_data.image_url)
-        book.image_url = f"/picture/{filename}"
+        book.image_url = media.media_url(filename)
+        # Старый файл удаляется, если на него больше никто не ссылается
+        await _delete_old_image(db, old_image_url)
             
     # Update other fields only if provided
     if book_data.title is not None:
@@ -138,20 +183,39 @@ async def put_book(
         )
         authors = result.scalars().all()
         book.authors = authors
-        
+
+    # Коллекции авторов и жанров не дают UPDATE books, версию поднимаем явно
+    await touch(db, Book, [book.id])
+    await service.refresh_snapshots([book.id])
+    invalidate_on_commit(db, f"book:{book.id}")
     await db.commit()
-    await db.refresh(book)
     return book
     
 
 @router_library.get("/authors/options/", response_model=List[AuthorResponse])
-async def get_authors_options(db: AsyncSession = Depends(get_db)):
+async def get_authors_options(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+):
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
+    validator = await service.get_options_validator(Author)
+    if is_not_modified(request, validator):
+        return not_modified(validator)
+    validator.apply(response)
     return await service.get_authors()
 
 @router_library.get("/genres/options/", response_model=List[GenreResponse])
-async def get_genres_options(db: AsyncSession = Depends(get_db)):
+async def get_genres_options(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+):
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
+    validator = await service.get_options_validator(Genre)
+    if is_not_modified(request, validator):
+        return not_modified(validator)
+    validator.apply(response)
     return await service.get_genres()
 
 @router_library.post("/authors/", response_model=AuthorResponse)
@@ -162,6 +226,7 @@ async def create_author(
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
     author = await service.create_author(author_data)
     await db.commit()
+    author_index.add(author.id, author.name)
     return author
 
 @router_library.post("/genres/", response_model=GenreResponse)
@@ -172,6 +237,7 @@ async def create_genre(
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
     genre = await service.create_genre(genre_data)
     await db.commit()
+    genre_index.add(genre.id, genre.name)
     return genre
 
 @router_library.get(
@@ -180,15 +246,27 @@ async def create_genre(
     summary="Получить книгу по ID"
 )
 async def get_book_by_id(
+    request: Request,
     book_id: int = Path(..., title="ID книги"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
-    try:
+
+    async def load():
         book = await service.get_book(book_id)
         if not book:
             raise HTTPException(status_code=404, detail="Книга не найдена")
         return book
+
+    try:
+        validator = await service.get_book_validator(book_id)
+        if is_not_modified(request, validator):
+            return not_modified(validator)
+        # ETag в ключе: запись другого воркера не отдаётся из устаревшего кэша
+        response = await cached_json(
+            request, f"book:{book_id}:{validator.etag}", BookResponse, load, _book_tags
+        )
+        return validator.apply(response)
     except HTTPException:
         raise
     except Exception as e:
@@ -208,6 +286,70 @@ async def create_book(
         await db.rollback()
         raise e
 
+@router_library.post("/books/import/", response_model=ImportReport)
+async def import_books(
+    file: UploadFile = File(..., description="CSV с заголовком, JSON Lines, MARC21 (.mrc) или ONIX (.xml)"),
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl|marc|onix)$", description="По умолчанию - по расширению"),
+    chunk_size: int = Query(settings.import_chunk_size, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Массовый импорт книг: поля BookImportRow, авторы и жанры - именами
+    (в CSV через ";"). Ошибочные строки пропускаются и перечисляются в отчёте.
+    """
+    importer = BookImporter(db, chunk_size)
+    try:
+        report = await importer.run(read_rows(file.file, detect_format(file, format)))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    if report.authors_created:
+        author_index.invalidate()
+    if report.genres_created:
+        genre_index.invalidate()
+    return report
+
+
+@router_library.post("/books/import/jobs/", status_code=202)
+async def submit_import_job(
+    request: Request,
+    file: UploadFile = File(..., description="CSV с заголовком, JSON Lines, MARC21 (.mrc) или ONIX (.xml)"),
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl|marc|onix)$", description="По умолчанию - по расширению"),
+    chunk_size: int = Query(settings.import_chunk_size, ge=1, le=10000),
+):
+    """
+    Импорт большого файла в фоновом процессе: каждая пачка фиксируется
+    сразу, ход и итоговый отчёт - по status_url.
+    """
+    job_id = await import_jobs.submit(file, detect_format(file, format), chunk_size)
+    return {
+        "job_id": job_id,
+        "status_url": str(request.url_for("get_import_job", job_id=job_id)),
+    }
+
+
+@router_library.get("/books/import/jobs/{job_id}")
+async def get_import_job(job_id: str):
+    """status: queued | running | done | failed; bytes_read / bytes_total и счётчики строк."""
+    return import_jobs.status(job_id)
+
+
+@router_library.post("/books/covers/", response_model=List[CoverResult])
+async def upload_covers(
+    files: List[UploadFile] = File(..., description="<external_id>.<ext> или <id книги>.<ext>"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Обложки для импортированных книг; результат - по каждому файлу."""
+    try:
+        results = await attach_covers(db, files, MAX_FILE_SIZE)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return results
+
+
 @router_library.delete("/books/{book_id}")
 async def delete_book(
     book_id: int,
@@ -226,29 +368,35 @@ async def delete_book(
 @router_library.get("/authors/search/", response_model=List[AuthorResponse])
 async def search_authors(
     q: str = Query(..., min_length=1),
-    db: AsyncSession = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
 ):
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
-    return await service.search_authors(q)
+    return await service.search_authors(q, limit)
 
 @router_library.get("/genres/search/", response_model=List[GenreResponse])
 async def search_genres(
     q: str = Query(..., min_length=1),
-    db: AsyncSession = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
 ):
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
-    return await service.search_genres(q)
+    return await service.search_genres(q, limit)
 
 # Базовые эндпоинты
 @router_library.get("/authors/", response_model=List[AuthorResponse])
-async def get_authors(db: AsyncSession = Depends(get_db)):
+async def get_authors(request: Request, db: AsyncSession = Depends(get_read_db)):
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
-    return await service.get_authors()
+    return await cached_json(
+        request, "authors", List[AuthorResponse], service.get_authors, lambda _: ["authors"]
+    )
 
 @router_library.get("/genres/", response_model=List[GenreResponse])
-async def get_genres(db: AsyncSession = Depends(get_db)):
+async def get_genres(request: Request, db: AsyncSession = Depends(get_read_db)):
     service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
-    return await service.get_genres()
+    return await cached_json(
+        request, "genres", List[GenreResponse], service.get_genres, lambda _: ["genres"]
+    )
 
 
 @router_library.put("/authors/{author_id}", response_model=AuthorResponse)
@@ -262,8 +410,13 @@ async def update_author(
         raise HTTPException(404, "Author not found")
     
     author.name = author_data.name
+    service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
+    await touch(db, Book, service.author_book_ids(author_id))
+    await service.refresh_snapshots(service.author_book_ids(author_id))
+    invalidate_on_commit(db, "authors", f"author:{author_id}")
     await db.commit()
     await db.refresh(author)
+    author_index.add(author.id, author.name)
     return author
 
 @router_library.put("/genres/{genre_id}", response_model=GenreResponse)
@@ -277,8 +430,13 @@ async def update_genre(
         raise HTTPException(404, "Genre not found")
     
     genre.name = genre_data.name
+    service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
+    await touch(db, Book, service.genre_book_ids(genre_id))
+    await service.refresh_snapshots(service.genre_book_ids(genre_id))
+    invalidate_on_commit(db, "genres", f"genre:{genre_id}")
     await db.commit()
     await db.refresh(genre)
+    genre_index.add(genre.id, genre.name)
     return genre
 
 
@@ -287,12 +445,18 @@ async def delete_genre(
     genre_id: int,
     db: AsyncSession = Depends(get_db)
 ):
-    genre = await db.get(Genre, genre_id)
-    if not genre:
+    if await db.scalar(select(Genre.id).where(Genre.id == genre_id)) is None:
         raise HTTPException(404, "Genre not found")
-    
-    await db.delete(genre)
+
+    service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
+    exhibition_ids = await service.snapshot_exhibitions(service.genre_book_ids(genre_id))
+    await touch(db, Book, service.genre_book_ids(genre_id))
+    # Связи с книгами удаляет БД (ON DELETE CASCADE), без загрузки коллекции
+    await db.execute(delete(Genre).where(Genre.id == genre_id).execution_options(synchronize_session=False))
+    await SnapshotService(db).refresh(*exhibition_ids)
+    invalidate_on_commit(db, "genres", f"genre:{genre_id}")
     await db.commit()
+    genre_index.remove(genre_id)
     return {"status": "success", "message": "Genres deleted"}
 
 
@@ -301,12 +465,18 @@ async def delete_author(
     author_id: int,
     db: AsyncSession = Depends(get_db)
 ):
-    author = await db.get(Author, author_id)
-    if not author:
+    if await db.scalar(select(Author.id).where(Author.id == author_id)) is None:
         raise HTTPException(404, "Author not found")
-    
-    await db.delete(author)
+
+    service = BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE)
+    exhibition_ids = await service.snapshot_exhibitions(service.author_book_ids(author_id))
+    await touch(db, Book, service.author_book_ids(author_id))
+    # Связи с книгами удаляет БД (ON DELETE CASCADE), без загрузки коллекции
+    await db.execute(delete(Author).where(Author.id == author_id).execution_options(synchronize_session=False))
+    await SnapshotService(db).refresh(*exhibition_ids)
+    invalidate_on_commit(db, "authors", f"author:{author_id}")
     await db.commit()
+    author_index.remove(author_id)
     return {"status": "success", "message": "Author deleted"}
 
 # Книги для контент
@@ -324,7 +494,7 @@ router = APIRouter(prefix="/content/{content_id}")
 @router.get("/books/", response_model=List[BookResponse])
 async def get_all_content_book(
     content_id: int, 
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     service = BooksContentService(db, MEDIA_DIR, MAX_FILE_SIZE)
     try:
@@ -356,7 +526,7 @@ async def unlink_book_from_content(
 async def get_content_book_by_id(
     content_id: int, 
     book_id: int, 
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     service = BooksContentService(db, MEDIA_DIR, MAX_FILE_SIZE)
     try:
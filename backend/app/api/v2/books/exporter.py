@@ -0,0 +1,61 @@
+"""
+Выгрузка каталога в CSV или NDJSON потоком.
+
+Книги читаются пачками по id (BooksFondsService.export_chunks), каждая
+пачка сразу превращается в байты и отдаётся, поэтому память не зависит
+от размера каталога. Формат совместим с импортом (importer.py): авторы
+и жанры - именами, в CSV через "; ".
+"""
+import csv
+import io
+from typing import AsyncIterator
+
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .services import BooksFondsService, ID_CHUNK
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+CSV_FIELDS = (
+    "id",
+    "external_id",
+    "title",
+    "authors",
+    "genres",
+    "year_of_publication",
+    "annotations",
+    "library_description",
+    "image_url",
+)
+
+
+def export_format(name: str) -> str:
+    # JSON Lines и NDJSON - один и тот же формат
+    return "ndjson" if name == "jsonl" else name
+
+
+async def export_catalog(db: AsyncSession, fmt: str, chunk_size: int = ID_CHUNK) -> AsyncIterator[bytes]:
+    service = BooksFondsService(db, None, 0)
+    if fmt == "csv":
+        # BOM - чтобы Excel открыл кириллицу; импорт его пропускает
+        yield "\ufeff".encode() + _csv_lines([CSV_FIELDS])
+    async for cards in service.export_chunks(chunk_size):
+        for card in cards:
+            card["authors"] = [author["name"] for author in card["authors"]]
+            card["genres"] = [genre["name"] for genre in card["genres"]]
+        if fmt == "csv":
+            yield _csv_lines(
+                ["; ".join(card[field]) if field in ("authors", "genres") else card[field] for field in CSV_FIELDS]
+                for card in cards
+            )
+        else:
+            yield b"".join(orjson.dumps(card) + b"\n" for card in cards)
+
+
+def _csv_lines(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
@@ -0,0 +1,245 @@
+"""
+Потоковые читатели библиографических форматов для импорта каталога.
+
+Каждый читатель отдаёт (номер записи, словарь полей BookImportRow или
+текст ошибки) - как importer.read_rows, поэтому дальше записи идут через
+тот же BookImporter. В памяти одна запись за раз.
+
+MARC21 (ISO 2709, .mrc):
+    001        -> external_id
+    245 $a $b  -> title
+    520 $a     -> annotations
+    260/264 $c -> year_of_publication (иначе 008/07-10)
+    100/110/700/710 $a -> authors
+    655 $a (иначе 650 $a) -> genres
+
+ONIX for Books 2.1 / 3.0 (XML, reference-теги), пути от Product:
+    RecordReference -> external_id
+    DescriptiveDetail/TitleDetail (2.1: Title) с TitleType 01 -> title
+    CollateralDetail/TextContent/Text (2.1: OtherText/Text) -> annotations
+    PublishingDetail/PublishingDate с PublishingDateRole 01
+        (2.1: PublicationDate) -> year_of_publication
+    [DescriptiveDetail/]Contributor -> authors
+    [DescriptiveDetail/]Subject/SubjectHeadingText -> genres
+Заголовки и участники серий (Collection, Series), даты содержания и т.п.
+не читаются.
+"""
+import re
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+RECORD_TERMINATOR = b"\x1d"
+FIELD_TERMINATOR = b"\x1e"
+SUBFIELD_DELIMITER = b"\x1f"
+LEADER_LENGTH = 24
+DIRECTORY_ENTRY = 12
+YEAR = re.compile(r"\d{4}")
+# Знаки ISBD в конце подполей: "Война и мир /", "Толстой, Лев,"
+TRAILING_PUNCTUATION = " /:;,.="
+
+Row = Tuple[int, object]
+
+
+def _clean(value: str) -> str:
+    return value.strip().rstrip(TRAILING_PUNCTUATION).strip()
+
+
+def _decode(data: bytes, utf8: bool) -> str:
+    # Leader/09 = "a" - UTF-8; иначе MARC-8, а в выгрузках российских АБИС - обычно cp1251
+    if utf8:
+        return data.decode("utf-8", errors="replace")
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("cp1251", errors="replace")
+
+
+def parse_marc_record(record: bytes) -> Dict[str, List]:
+    """Тег -> список значений: строка для 00X, словарь код -> [значения] для остальных."""
+    leader = record[:LEADER_LENGTH].decode("ascii")
+    base_address = int(leader[12:17])
+    utf8 = leader[9] == "a"
+    directory = record[LEADER_LENGTH:base_address - 1]
+    if len(directory) % DIRECTORY_ENTRY:
+        raise ValueError("Повреждён справочник записи")
+
+    fields: Dict[str, List] = {}
+    for offset in range(0, len(directory), DIRECTORY_ENTRY):
+        entry = directory[offset:offset + DIRECTORY_ENTRY].decode("ascii")
+        tag, length, start = entry[:3], int(entry[3:7]), int(entry[7:12])
+        data = record[base_address + start:base_address + start + length].rstrip(FIELD_TERMINATOR)
+        if tag < "010":
+            fields.setdefault(tag, []).append(_decode(data, utf8))
+            continue
+        subfields: Dict[str, List[str]] = {}
+        # Первые два байта - индикаторы
+        for chunk in data[2:].split(SUBFIELD_DELIMITER)[1:]:
+            if chunk:
+                subfields.setdefault(chr(chunk[0]), []).append(_decode(chunk[1:], utf8))
+        fields.setdefault(tag, []).append(subfields)
+    return fields
+
+
+def marc_to_row(fields: Dict[str, List]) -> dict:
+    def first(tag: str, code: str) -> Optional[str]:
+        for subfields in fields.get(tag, ()):
+            if subfields.get(code):
+                return _clean(subfields[code][0])
+        return None
+
+    def every(tags, code: str) -> List[str]:
+        return [_clean(value) for tag in tags for subfields in fields.get(tag, ()) for value in subfields.get(code, ())]
+
+    title = " : ".join(filter(None, (first("245", "a"), first("245", "b"))))
+    year = None
+    for tag in ("264", "260"):
+        match = YEAR.search(first(tag, "c") or "")
+        if match:
+            year = match.group()
+            break
+    if year is None and fields.get("008"):
+        candidate = fields["008"][0][7:11]
+        year = candidate if candidate.isdigit() else None
+
+    return {
+        "external_id": fields["001"][0].strip() if fields.get("001") else None,
+        "title": title,
+        "annotations": first("520", "a"),
+        "year_of_publication": year,
+        "authors": every(("100", "110", "700", "710"), "a"),
+        "genres": every(("655",), "a") or every(("650",), "a"),
+    }
+
+
+def read_marc(file: BinaryIO) -> Iterator[Row]:
+    number = 0
+    while True:
+        # Некоторые АБИС разделяют записи переводом строки
+        leader = file.read(LEADER_LENGTH).lstrip(b"\r\n")
+        while leader and len(leader) < LEADER_LENGTH:
+            more = file.read(LEADER_LENGTH - len(leader))
+            if not more:
+                break
+            leader = (leader + more).lstrip(b"\r\n")
+        if not leader.strip():
+            return
+        number += 1
+        try:
+            length = int(leader[:5])
+            if length <= LEADER_LENGTH:
+                raise ValueError
+        except ValueError:
+            yield number, "Некорректный маркер записи MARC"
+            _skip_to_terminator(file)
+            continue
+        record = leader + file.read(length - LEADER_LENGTH)
+        if not record.endswith(RECORD_TERMINATOR):
+            yield number, "Длина записи MARC не совпадает с маркером"
+            _skip_to_terminator(file)
+            continue
+        try:
+            yield number, marc_to_row(parse_marc_record(record))
+        except (ValueError, IndexError, UnicodeDecodeError) as e:
+            yield number, f"Запись MARC не разобрана: {e}"
+
+
+def _skip_to_terminator(file: BinaryIO) -> None:
+    """После битой записи - к началу следующей."""
+    while True:
+        byte = file.read(1)
+        if not byte or byte == RECORD_TERMINATOR:
+            return
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _path(element: ET.Element, *names: str) -> List[ET.Element]:
+    """Элементы по пути из прямых потомков: вложенные composite серий не попадают."""
+    found = [element]
+    for name in names:
+        found = [child for parent in found for child in parent if _local(child.tag) == name]
+    return found
+
+
+def _text(element: ET.Element, *names: str) -> Optional[str]:
+    for child in _path(element, *names):
+        if child.text and child.text.strip():
+            return child.text.strip()
+    return None
+
+
+def _onix_title(product: ET.Element) -> Optional[str]:
+    # TitleType 01 - заголовок самого издания (без кода тоже он)
+    for detail in _path(product, "DescriptiveDetail", "TitleDetail") + _path(product, "Title"):
+        if _text(detail, "TitleType") not in (None, "01"):
+            continue
+        # 3.0: TitleElement уровня 01 (продукт); 2.1: поля прямо в Title
+        elements = [
+            element for element in _path(detail, "TitleElement")
+            if _text(element, "TitleElementLevel") in (None, "01")
+        ] or [detail]
+        for element in elements:
+            text = _text(element, "TitleText") or " ".join(
+                filter(None, (_text(element, "TitlePrefix"), _text(element, "TitleWithoutPrefix")))
+            )
+            if text:
+                return " : ".join(filter(None, (text, _text(element, "Subtitle"))))
+    return _text(product, "DistinctiveTitle")
+
+
+def _onix_year(product: ET.Element) -> Optional[str]:
+    # PublishingDateRole 01 - дата выхода издания; 2.1 - PublicationDate
+    dates = [
+        _text(date, "Date") for date in _path(product, "PublishingDetail", "PublishingDate")
+        if _text(date, "PublishingDateRole") in (None, "01")
+    ]
+    dates.append(_text(product, "PublicationDate"))
+    for value in filter(None, dates):
+        match = YEAR.search(value)
+        if match:
+            return match.group()
+    return None
+
+
+def onix_to_row(product: ET.Element) -> dict:
+    authors = []
+    for contributor in _path(product, "DescriptiveDetail", "Contributor") + _path(product, "Contributor"):
+        name = _text(contributor, "PersonName") or _text(contributor, "CorporateName")
+        if not name:
+            name = " ".join(filter(None, (_text(contributor, "NamesBeforeKey"), _text(contributor, "KeyNames"))))
+        if name:
+            authors.append(name)
+    subjects = _path(product, "DescriptiveDetail", "Subject") + _path(product, "Subject")
+
+    return {
+        "external_id": _text(product, "RecordReference"),
+        "title": _onix_title(product) or "",
+        # ONIX 3.0 - TextContent/Text, 2.1 - OtherText/Text
+        "annotations": _text(product, "CollateralDetail", "TextContent", "Text") or _text(product, "OtherText", "Text"),
+        "year_of_publication": _onix_year(product),
+        "authors": authors,
+        "genres": [heading for subject in subjects if (heading := _text(subject, "SubjectHeadingText"))],
+    }
+
+
+def read_onix(file: BinaryIO) -> Iterator[Row]:
+    number = 0
+    parents = []
+    try:
+        for event, element in ET.iterparse(file, events=("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            if _local(element.tag) != "Product":
+                continue
+            number += 1
+            yield number, onix_to_row(element)
+            # Разобранный Product больше не нужен: память не растёт с файлом
+            if parents:
+                parents[-1].remove(element)
+            element.clear()
+    except ET.ParseError as e:
+        yield number + 1, f"Некорректный XML ONIX: {e}"
@@ -0,0 +1,337 @@
+"""
+Массовый импорт каталога: CSV, JSON Lines, MARC21 или ONIX -> книги,
+авторы, жанры (читатели MARC и ONIX - в formats.py).
+
+Строки читаются и проверяются пачками по chunk_size (разбор файла - в
+пуле потоков). На пачку:
+
+- авторы и жанры сопоставляются по имени одним SELECT ... IN, а
+  недостающие вставляются одним executemany (жанры - INSERT IGNORE,
+  имя уникально);
+- книги и строки связей вставляются executemany;
+- ошибки проверки строки не останавливают импорт и попадают в отчёт.
+
+MySQL не возвращает id из executemany, поэтому id книг читаются обратно
+по external_id. Строкам без external_id на время импорта ставится
+временный ключ, в конце пачки он очищается одним UPDATE.
+
+Большие файлы импортируются в отдельном процессе - см. jobs.py.
+
+Обложки привязываются позже: файл <external_id>.<ext> (или <id книги>.<ext>)
+через attach_covers().
+"""
+import asyncio
+import csv
+import io
+import json
+import uuid
+from itertools import islice
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ....core import media
+from ....core.name_index import normalize
+from ....core.response_cache import invalidate_on_commit
+from ....models import Author, Book, Genre
+from ....models.books import book_authors, book_genres
+from ..exhibitions.services import SnapshotService
+from .formats import read_marc, read_onix
+from .schemas import BookImportRow, CoverResult, ImportReport
+
+IMPORT_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    "text/csv": "csv",
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    ".mrc": "marc",
+    ".marc": "marc",
+    "application/marc": "marc",
+    ".onix": "onix",
+    ".xml": "onix",
+    "application/xml": "onix",
+    "text/xml": "onix",
+}
+FORMATS = ("csv", "jsonl", "marc", "onix")
+# Сколько ошибок строк показывать в отчёте (считаются все)
+MAX_REPORTED_ERRORS = 1000
+# Сколько значений передавать в одном IN (...)
+LOOKUP_CHUNK = 1000
+TEMP_KEY_PREFIX = "~import:"
+
+Row = Tuple[int, Any]
+
+
+def detect_format(upload: UploadFile, explicit: Optional[str] = None) -> str:
+    fmt = explicit or IMPORT_FORMATS.get(Path(upload.filename or "").suffix.lower()) \
+        or IMPORT_FORMATS.get(upload.content_type or "")
+    if fmt not in FORMATS:
+        raise HTTPException(415, "Ожидается CSV, JSON Lines, MARC21 или ONIX")
+    return fmt
+
+
+def read_rows(file: BinaryIO, fmt: str) -> Iterator[Row]:
+    """(номер строки или записи, словарь полей или текст ошибки разбора)."""
+    if fmt == "marc":
+        yield from read_marc(file)
+        return
+    if fmt == "onix":
+        yield from read_onix(file)
+        return
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield line_no, f"Некорректный JSON: {e}"
+                continue
+            yield line_no, data if isinstance(data, dict) else "Ожидается JSON-объект"
+    except UnicodeDecodeError:
+        yield 0, "Файл должен быть в UTF-8"
+    finally:
+        # Файл загрузки закрывает FastAPI, не обёртка
+        if not file.closed:
+            text.detach()
+
+
+class BookImporter:
+    def __init__(self, db: AsyncSession, chunk_size: int):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.token = uuid.uuid4().hex
+        self.report = {
+            "total": 0, "imported": 0, "failed": 0, "authors_created": 0, "genres_created": 0,
+            "books": [], "errors": [],
+        }
+        self._seen_external_ids = set()
+
+    async def run(
+        self,
+        rows: Iterable[Row],
+        on_chunk: Optional[Callable[[dict], Awaitable[None]]] = None,
+    ) -> ImportReport:
+        """
+        Импорт всех строк в текущей транзакции; COMMIT - за вызывающим.
+        on_chunk(report) вызывается после каждой пачки: там можно
+        зафиксировать её и сообщить прогресс.
+        """
+        rows = iter(rows)
+        loop = asyncio.get_running_loop()
+        while chunk := await loop.run_in_executor(None, lambda: list(islice(rows, self.chunk_size))):
+            await self.import_chunk(chunk)
+            if on_chunk is not None:
+                await on_chunk(self.report)
+        if self.report["authors_created"] or self.report["genres_created"]:
+            invalidate_on_commit(self.db, "authors", "genres")
+        return ImportReport.model_validate(self.report)
+
+    async def import_chunk(self, chunk: List[Row]) -> None:
+        self.report["total"] += len(chunk)
+        valid = await self._validate(chunk)
+        if not valid:
+            return
+
+        authors = await self._resolve(Author, [name for _, row in valid for name in row.authors])
+        genres = await self._resolve(Genre, [name for _, row in valid for name in row.genres])
+        self.report["authors_created"] += authors.pop(None, 0)
+        self.report["genres_created"] += genres.pop(None, 0)
+        valid = self._drop_unresolved(valid, authors, genres)
+        if not valid:
+            return
+
+        keys = {}
+        for line_no, row in valid:
+            keys[line_no] = row.external_id or f"{TEMP_KEY_PREFIX}{self.token}:{line_no}"
+        await self.db.execute(insert(Book.__table__), [
+            {
+                "title": row.title,
+                "annotations": row.annotations,
+                "library_description": row.library_description,
+                "year_of_publication": row.year_of_publication,
+                "external_id": keys[line_no],
+            }
+            for line_no, row in valid
+        ])
+        ids = await self._lookup_column(Book.external_id, Book.id, list(keys.values()))
+
+        author_links, genre_links = [], []
+        for line_no, row in valid:
+            book_id = ids[keys[line_no]]
+            for link_rows, names, resolved, column in (
+                (author_links, row.authors, authors, "author_id"),
+                (genre_links, row.genres, genres, "genre_id"),
+            ):
+                linked = {resolved[normalize(name)] for name in names}
+                link_rows.extend({"book_id": book_id, column: item_id} for item_id in sorted(linked))
+            self.report["books"].append({"row": line_no, "id": book_id, "external_id": row.external_id})
+        if author_links:
+            await self.db.execute(insert(book_authors), author_links)
+        if genre_links:
+            await self.db.execute(insert(book_genres), genre_links)
+        if any(row.external_id is None for _, row in valid):
+            await self._clear_temp_keys()
+        self.report["imported"] += len(valid)
+
+    async def _validate(self, chunk: List[Row]) -> List[Tuple[int, BookImportRow]]:
+        valid = []
+        for line_no, raw in chunk:
+            if isinstance(raw, str):
+                self._fail(line_no, None, [raw])
+                continue
+            try:
+                row = BookImportRow.model_validate(raw)
+            except ValidationError as e:
+                external_id = raw.get("external_id")
+                self._fail(line_no, str(external_id) if external_id is not None else None, [
+                    f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+                ])
+                continue
+            if row.external_id is not None:
+                if row.external_id in self._seen_external_ids:
+                    self._fail(line_no, row.external_id, ["external_id повторяется в файле"])
+                    continue
+                self._seen_external_ids.add(row.external_id)
+            valid.append((line_no, row))
+
+        # Уже существующие книги не перезаписываются
+        existing = await self._lookup_column(
+            Book.external_id, Book.id, [row.external_id for _, row in valid if row.external_id]
+        )
+        if existing:
+            for line_no, row in valid:
+                if row.external_id in existing:
+                    self._fail(line_no, row.external_id, [f"Книга с external_id уже есть (id {existing[row.external_id]})"])
+            valid = [(line_no, row) for line_no, row in valid if row.external_id not in existing]
+        return valid
+
+    def _drop_unresolved(self, valid, authors: Dict[str, int], genres: Dict[str, int]):
+        # Имя, которое СУБД считает равным другому (например, по правилам сравнения),
+        # может не найтись и после вставки: такая строка не импортируется
+        kept = []
+        for line_no, row in valid:
+            unresolved = [name for name in row.authors if normalize(name) not in authors]
+            unresolved += [name for name in row.genres if normalize(name) not in genres]
+            if unresolved:
+                self._fail(line_no, row.external_id, [f"Не удалось сопоставить: {', '.join(unresolved)}"])
+            else:
+                kept.append((line_no, row))
+        return kept
+
+    async def _resolve(self, model, names: List[str]) -> Dict[Any, int]:
+        """
+        normalize(имя) -> id; недостающие создаются с написанием первого
+        вхождения в файле. Ключ None - сколько создано.
+        """
+        wanted = {}
+        for name in names:
+            wanted.setdefault(normalize(name), name)
+        found = await self._lookup_names(model, list(wanted.values()))
+        missing = [name for key, name in wanted.items() if key not in found]
+        for start in range(0, len(missing), LOOKUP_CHUNK):
+            await self.db.execute(
+                insert(model.__table__)
+                .prefix_with("IGNORE", dialect="mysql")
+                .prefix_with("OR IGNORE", dialect="sqlite"),
+                [{"name": name} for name in missing[start:start + LOOKUP_CHUNK]],
+            )
+        created = 0
+        if missing:
+            before = len(found)
+            found.update(await self._lookup_names(model, missing))
+            created = len(found) - before
+        found[None] = created
+        return found
+
+    async def _lookup_names(self, model, names: List[str]) -> Dict[str, int]:
+        found = {}
+        for start in range(0, len(names), LOOKUP_CHUNK):
+            result = await self.db.execute(
+                select(model.name, model.id)
+                .where(model.name.in_(names[start:start + LOOKUP_CHUNK]))
+                .order_by(model.id)
+            )
+            for name, item_id in result:
+                # Среди одноимённых берётся самый старый
+                found.setdefault(normalize(name), item_id)
+        return found
+
+    async def _lookup_column(self, key_column, value_column, keys: List[str]) -> Dict[str, int]:
+        found = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            result = await self.db.execute(
+                select(key_column, value_column).where(key_column.in_(keys[start:start + LOOKUP_CHUNK]))
+            )
+            found.update(result.all())
+        return found
+
+    async def _clear_temp_keys(self) -> None:
+        await self.db.execute(
+            update(Book)
+            .where(Book.external_id.like(f"{TEMP_KEY_PREFIX}{self.token}:%"))
+            .values(external_id=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    def _fail(self, line_no: int, external_id: Optional[str], errors: List[str]) -> None:
+        self.report["failed"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"row": line_no, "external_id": external_id or None, "errors": errors})
+
+
+async def attach_covers(db: AsyncSession, files: List[UploadFile], max_size: int) -> List[CoverResult]:
+    """
+    Обложки к уже импортированным книгам: имя файла без расширения -
+    external_id книги, а если такого нет и имя - число, то id книги.
+    """
+    stems = [Path(upload.filename or "").stem for upload in files]
+    by_external = dict(
+        (await db.execute(select(Book.external_id, Book.id).where(Book.external_id.in_(stems)))).all()
+    )
+    numeric = [int(stem) for stem in stems if stem not in by_external and stem.isdigit()]
+    by_id = set((await db.execute(select(Book.id).where(Book.id.in_(numeric)))).scalars()) if numeric else set()
+
+    results = []
+    updated = []
+    for upload, stem in zip(files, stems):
+        book_id = by_external.get(stem)
+        if book_id is None and stem.isdigit() and int(stem) in by_id:
+            book_id = int(stem)
+        if book_id is None:
+            results.append(CoverResult(filename=upload.filename or "", error="Книга не найдена"))
+            continue
+        try:
+            filename = await media.store_upload(upload, max_size)
+        except HTTPException as e:
+            results.append(CoverResult(filename=upload.filename or "", book_id=book_id, error=e.detail))
+            continue
+        url = media.media_url(filename)
+        old_url = await db.scalar(select(Book.image_url).where(Book.id == book_id))
+        await db.execute(
+            update(Book)
+            .where(Book.id == book_id)
+            .values(image_url=url)
+            .execution_options(synchronize_session=False)
+        )
+        # Старый файл удаляется после COMMIT, если на него больше никто не ссылается
+        await media.release(db, old_url)
+        invalidate_on_commit(db, f"book:{book_id}")
+        updated.append(book_id)
+        results.append(CoverResult(filename=upload.filename or "", book_id=book_id, image_url=url))
+
+    if updated:
+        await SnapshotService(db).refresh_for_books(updated)
+    return results
@@ -0,0 +1,174 @@
+"""
+Фоновый импорт больших файлов каталога в отдельном процессе.
+
+Загрузка сохраняется на диск кусками в <import_dir>/<job_id>/upload, а
+разбор и вставки идут в пуле процессов: ни разбор MARC/XML, ни pydantic не
+занимают event loop API. Процесс работает со своим движком БД и фиксирует
+каждую пачку, поэтому в памяти только текущая пачка, а уже загруженное
+видно сразу.
+
+Прогресс пишется в <job_id>/progress.json (атомарно, через os.replace),
+так что статус задачи отдаёт любой воркер uvicorn. Каталоги задач старше
+JOB_TTL удаляются при следующей загрузке.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional, Set
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from ....core.config import settings
+from .importer import BookImporter, read_rows
+from .services import author_index, genre_index
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK = 1024 * 1024
+# Сколько хранить каталог задачи с отчётом
+JOB_TTL = 24 * 3600
+PROGRESS_FILE = "progress.json"
+UPLOAD_FILE = "upload"
+
+
+def jobs_dir() -> Path:
+    return Path(settings.import_dir or Path(tempfile.gettempdir()) / "library-imports")
+
+
+def write_progress(job_dir: Path, progress: dict) -> None:
+    tmp = job_dir / f".{PROGRESS_FILE}.tmp"
+    tmp.write_text(json.dumps(progress, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, job_dir / PROGRESS_FILE)
+
+
+def run_import_job(job_dir: str, fmt: str, chunk_size: int) -> dict:
+    """Точка входа процесса пула: импорт файла задачи, возвращает итоговый прогресс."""
+    return asyncio.run(_import_job(Path(job_dir), fmt, chunk_size))
+
+
+async def _import_job(job_dir: Path, fmt: str, chunk_size: int) -> dict:
+    upload = job_dir / UPLOAD_FILE
+    progress = {"status": "running", "format": fmt, "bytes_total": upload.stat().st_size, "bytes_read": 0}
+    # Свой движок без пула: соединения родительского процесса сюда не попадают
+    engine = create_async_engine(settings.db_url, poolclass=NullPool)
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+    try:
+        with open(upload, "rb") as file:
+            async with session_factory() as db:
+                async def on_chunk(report: dict) -> None:
+                    await db.commit()
+                    progress.update(
+                        bytes_read=file.tell(),
+                        **{key: report[key] for key in ("total", "imported", "failed", "authors_created", "genres_created")},
+                    )
+                    write_progress(job_dir, progress)
+
+                write_progress(job_dir, progress)
+                try:
+                    report = await BookImporter(db, chunk_size).run(read_rows(file, fmt), on_chunk)
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+        progress.update(status="done", bytes_read=progress["bytes_total"], report=report.model_dump())
+    except Exception as e:
+        logger.exception("Импорт %s завершился ошибкой", job_dir.name)
+        progress.update(status="failed", error=str(e))
+    finally:
+        await engine.dispose()
+        upload.unlink(missing_ok=True)
+    write_progress(job_dir, progress)
+    return progress
+
+
+class ImportJobs:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._background: Set[asyncio.Task] = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: fork процесса с потоками bcrypt и пула по умолчанию
+            # может унаследовать захваченные блокировки
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def submit(self, upload: UploadFile, fmt: str, chunk_size: int) -> str:
+        await asyncio.get_running_loop().run_in_executor(None, self._prune)
+        job_id = uuid.uuid4().hex
+        job_dir = jobs_dir() / job_id
+        job_dir.mkdir(parents=True)
+        async with aiofiles.open(job_dir / UPLOAD_FILE, "wb") as target:
+            while data := await upload.read(UPLOAD_CHUNK):
+                await target.write(data)
+        write_progress(job_dir, {"status": "queued", "format": fmt})
+
+        task = asyncio.create_task(self._run(job_id, str(job_dir), fmt, chunk_size))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return job_id
+
+    def status(self, job_id: str) -> dict:
+        # job_id - только hex: имя не выходит за каталог задач
+        if not job_id.isalnum():
+            raise HTTPException(404, "Задача импорта не найдена")
+        try:
+            return json.loads((jobs_dir() / job_id / PROGRESS_FILE).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise HTTPException(404, "Задача импорта не найдена")
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, job_id: str, job_dir: str, fmt: str, chunk_size: int) -> None:
+        try:
+            progress = await asyncio.get_running_loop().run_in_executor(
+                self.executor, run_import_job, job_dir, fmt, chunk_size
+            )
+        except Exception as e:
+            logger.exception("Процесс импорта %s упал", job_id)
+            if isinstance(e, BrokenProcessPool):
+                # Упавший процесс ломает весь пул: следующая задача создаст новый
+                self.close()
+            write_progress(Path(job_dir), {"status": "failed", "format": fmt, "error": str(e)})
+            return
+        # Индексы автодополнения этого воркера; другие воркеры обновятся по max_age
+        report = progress.get("report") or progress
+        if report.get("authors_created"):
+            author_index.invalidate()
+        if report.get("genres_created"):
+            genre_index.invalidate()
+
+    @staticmethod
+    def _prune() -> None:
+        root = jobs_dir()
+        if not root.is_dir():
+            return
+        expired = time.time() - JOB_TTL
+        for job_dir in root.iterdir():
+            try:
+                if job_dir.stat().st_mtime < expired:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+            except FileNotFoundError:
+                continue
+
+
+import_jobs = ImportJobs(workers=settings.import_workers)
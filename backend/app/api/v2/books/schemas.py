@@ -124,4 +124,65 @@ class BookCreate(BaseModel):
             image_url=image_url,
             genre_ids=genre_ids_list,
             author_ids=author_ids_list,
-        )
\ No newline at end of file
+        )
+
+class BookImportRow(BaseModel):
+    """Строка импорта каталога (CSV или JSON Lines)."""
+    external_id: Optional[str] = Field(None, max_length=64)
+    title: str = Field(..., min_length=1)
+    annotations: Optional[str] = None
+    library_description: Optional[str] = None
+    year_of_publication: Optional[str] = None
+    authors: List[str] = []
+    genres: List[str] = []
+
+    @field_validator("external_id", "annotations", "library_description", "year_of_publication", mode="before")
+    def empty_to_none(cls, value):
+        # В JSON год и номер часто числа
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if isinstance(value, str):
+            value = value.strip()
+        return value or None
+
+    @field_validator("title", mode="before")
+    def strip_title(cls, value):
+        return value.strip() if isinstance(value, str) else value
+
+    @field_validator("authors", "genres", mode="before")
+    def split_names(cls, value):
+        # В CSV имена через ";", в JSON Lines - строка или список
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = value.split(";")
+        return [name.strip() for name in value if isinstance(name, str) and name.strip()]
+
+
+class ImportRowError(BaseModel):
+    row: int
+    external_id: Optional[str] = None
+    errors: List[str]
+
+
+class ImportedBook(BaseModel):
+    row: int
+    id: int
+    external_id: Optional[str] = None
+
+
+class ImportReport(BaseModel):
+    total: int
+    imported: int
+    failed: int
+    authors_created: int
+    genres_created: int
+    books: List[ImportedBook]
+    errors: List[ImportRowError]
+
+
+class CoverResult(BaseModel):
+    filename: str
+    book_id: Optional[int] = None
+    image_url: Optional[str] = None
+    error: Optional[str] = None
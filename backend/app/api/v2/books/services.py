@@ -1,14 +1,43 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, delete, func, and_, or_, union
+from sqlalchemy.dialects.mysql import match
 from pathlib import Path
-from typing import List, Optional
-import uuid
-import aiofiles
+from typing import AsyncIterator, List, Optional, Tuple
+import re
 from fastapi import HTTPException, UploadFile
 from ....models import Book, Author, Genre, ContentBlock
+from ....models.books import book_authors, book_genres
+from ....models.load_plans import BOOK_CARD, AUTHOR_OPTION, GENRE_OPTION
+from ....core.pagination import encode_cursor, decode_cursor
+from ....core.name_index import NameIndex
+from ....core.response_cache import invalidate_on_commit
+from ....core.conditional import Validator, make_validator
+from ....core import media
 from .schemas import BookCreate, AuthorCreate, GenreCreate
-  
+from ..exhibitions.services import SnapshotService
+
+
+# ngram_token_size сервера MySQL (по умолчанию 2)
+NGRAM_TOKEN_SIZE = 2
+# Операторы BOOLEAN MODE, которые нельзя пропускать из пользовательского ввода
+FULLTEXT_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+# Колонки BookResponse в порядке полей схемы (авторы и жанры - отдельно)
+BOOK_CARD_COLUMNS = (
+    Book.id,
+    Book.title,
+    Book.annotations,
+    Book.library_description,
+    Book.image_url,
+    Book.year_of_publication,
+)
+# Сколько id книг передавать в одном IN (...)
+ID_CHUNK = 1000
+
+# Индексы автодополнения; строятся при старте и обновляются после записей
+author_index = NameIndex()
+genre_index = NameIndex()
+
 
 class BooksFondsService:
     def __init__(self, db: AsyncSession, media_dir: Path, max_file_size: int):
@@ -17,18 +46,36 @@ class BooksFondsService:
         self.max_file_size = max_file_size
 
     async def get_book(self, book_id: int) -> Optional[Book]:
-        # Загружаем книгу с опциями selectinload для authors и genres
+        # Загружаем книгу вместе с авторами и жанрами
         stmt = (
             select(Book)
-            .options(
-                selectinload(Book.authors),
-                selectinload(Book.genres),
-            )
+            .options(*BOOK_CARD)
             .where(Book.id == book_id)
         )
         result = await self.db.execute(stmt)
         return result.scalar_one_or_none()
 
+    async def get_book_validator(self, book_id: int) -> Validator:
+        # Смена авторов и жанров поднимает версию книги (touch)
+        row = (await self.db.execute(
+            select(Book.version, Book.updated_at).where(Book.id == book_id)
+        )).one_or_none()
+        if row is None:
+            raise HTTPException(404, "Книга не найдена")
+        return make_validator("book", (book_id, row.version), row.updated_at)
+
+    async def get_options_validator(self, model) -> Validator:
+        """Справочник целиком: число строк ловит удаления, сумма версий - правки."""
+        count, max_id, versions, updated_at = (await self.db.execute(
+            select(
+                func.count(model.id),
+                func.max(model.id),
+                func.coalesce(func.sum(model.version), 0),
+                func.max(model.updated_at),
+            )
+        )).one()
+        return make_validator(model.__tablename__, (count, max_id, versions, updated_at), updated_at)
+
     async def get_filtered_books(
         self,
         author_id: Optional[List[int]],
@@ -36,57 +83,130 @@ class BooksFondsService:
         sort_order: Optional[str],
         search: Optional[str],
     ) -> List[Book]:
-        query = select(Book).options(
-            selectinload(Book.authors),
-            selectinload(Book.genres)
-        )
-
-        if author_id:
-            query = query.filter(Book.authors.any(Author.id.in_(author_id)))
-        
-        if genre_id:
-            query = query.filter(Book.genres.any(Genre.id.in_(genre_id)))
-        
-        if search:
-            pattern = f"%{search}%"
-            query = query.where(Book.title.ilike(pattern))
-        
-        if sort_order == "asc":
-            query = query.order_by(Book.title.asc())
-            
-        elif sort_order == "desc":
-            query = query.order_by(Book.title.desc())
-
+        query = self._filtered_query(author_id, genre_id, sort_order, search)
         result = await self.db.execute(query)
-        return result.scalars().unique().all()
+        return result.scalars().all()
 
+    async def get_book_cards(
+        self,
+        author_id: Optional[List[int]],
+        genre_id: Optional[List[int]],
+        sort_order: Optional[str],
+        search: Optional[str],
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Карточки книг (BookResponse) словарями из строк Core - для
+        serialization.dump_rows. Без cursor/limit - весь каталог, иначе
+        keyset-страница: (карточки, курсор следующей страницы).
+        """
+        paged = cursor is not None or limit is not None
+        query = self._filtered_query(
+            author_id, genre_id, sort_order, search, relevance=not paged, columns=BOOK_CARD_COLUMNS
+        )
+        if cursor:
+            query = query.where(self._after_cursor(sort_order, cursor))
+        if paged:
+            query = query.limit(limit + 1)
+        rows = (await self.db.execute(query)).all()
+
+        next_cursor = None
+        if paged and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            if sort_order in ("asc", "desc"):
+                next_cursor = encode_cursor(last.title, last.id)
+            else:
+                next_cursor = encode_cursor(last.id)
+
+        cards = {row.id: {**row._asdict(), "authors": [], "genres": []} for row in rows}
+        await self._attach_names(cards)
+        return list(cards.values()), next_cursor
+
+    async def _attach_names(self, cards: dict) -> None:
+        """Авторы и жанры карточек: по запросу на связь и пачку из ID_CHUNK книг."""
+        ids = list(cards)
+        links = (
+            ("authors", book_authors.c.author_id, Author),
+            ("genres", book_genres.c.genre_id, Genre),
+        )
+        for start in range(0, len(ids), ID_CHUNK):
+            chunk = ids[start:start + ID_CHUNK]
+            for key, foreign_id, model in links:
+                result = await self.db.execute(
+                    select(foreign_id.table.c.book_id, model.id, model.name)
+                    .join(model, model.id == foreign_id)
+                    .where(foreign_id.table.c.book_id.in_(chunk))
+                )
+                seen = set()
+                for book_id, item_id, name in result:
+                    # У таблиц связей нет уникального ключа; ORM дубли схлопывает, здесь так же
+                    if (book_id, item_id) not in seen:
+                        seen.add((book_id, item_id))
+                        cards[book_id][key].append({"id": item_id, "name": name})
+
+    async def export_chunks(self, chunk_size: int = ID_CHUNK) -> AsyncIterator[List[dict]]:
+        """
+        Весь каталог пачками по id для выгрузки: на пачку один запрос книг
+        (WHERE id > последний ORDER BY id LIMIT) и по одному запросу авторов
+        и жанров. В памяти только текущая пачка; в одной транзакции
+        (REPEATABLE READ) все пачки видят один снимок базы.
+        """
+        last_id = 0
+        while True:
+            rows = (await self.db.execute(
+                select(*BOOK_CARD_COLUMNS, Book.external_id)
+                .where(Book.id > last_id)
+                .order_by(Book.id)
+                .limit(chunk_size)
+            )).all()
+            if not rows:
+                return
+            cards = {row.id: {**row._asdict(), "authors": [], "genres": []} for row in rows}
+            await self._attach_names(cards)
+            yield list(cards.values())
+            last_id = rows[-1].id
+
+    async def stream_books(
+        self,
+        author_id: Optional[List[int]],
+        genre_id: Optional[List[int]],
+        sort_order: Optional[str],
+        search: Optional[str],
+        batch_size: int = 500,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Карточки книг пачками keyset-страниц get_book_cards: на пачку один
+        запрос книг и по запросу авторов и жанров, курсор между пачками не
+        держится открытым. Порядок - как у постраничного списка (при поиске
+        без sort_order - по id, не по релевантности).
+        """
+        cursor = None
+        while True:
+            cards, cursor = await self.get_book_cards(
+                author_id, genre_id, sort_order, search, cursor=cursor, limit=batch_size
+            )
+            if cards:
+                yield cards
+            if cursor is None:
+                return
 
     async def create_book(self, book_data: BookCreate) -> Book:
         try:
-            # Чтение и проверка файла
-            file_content = await book_data.image_url.read()
-            if len(file_content) > self.max_file_size:
-                raise HTTPException(status_code=413, detail="File too large")
-            await book_data.image_url.seek(0)
-
             # Получаем авторов и жанры
             authors = [await self._get_author_by_id(aid) for aid in book_data.author_ids]
             genres = [await self._get_genre_by_id(gid) for gid in book_data.genre_ids]
 
-            # Сохраняем изображение
-            file_ext = book_data.image_url.filename.split(".")[-1]
-            filename = f"{uuid.uuid4()}.{file_ext}"
-            file_path = self.media_dir / filename
-            
-            async with aiofiles.open(file_path, "wb") as f:
-                await f.write(file_content)
+            # Файл копируется кусками; размер и тип проверяются по ходу копирования
+            filename = await media.store_upload(book_data.image_url, self.max_file_size)
 
             # Создаем книгу
             new_book = Book(
                 title=book_data.title,
                 annotations=book_data.annotations,
                 library_description=book_data.library_description,
-                image_url=f"/picture/{filename}",
+                image_url=media.media_url(filename),
                 year_of_publication=book_data.year_of_publication,
                 authors=authors,
                 genres=genres,
@@ -98,7 +218,7 @@ class BooksFondsService:
             # Возвращаем полный объект с отношениями
             result = await self.db.execute(
                 select(Book)
-                .options(selectinload(Book.authors), selectinload(Book.genres))
+                .options(*BOOK_CARD)
                 .where(Book.id == new_book.id)
             )
             return result.scalar_one()
@@ -109,54 +229,146 @@ class BooksFondsService:
             raise HTTPException(500, f"Internal server error: {str(e)}")
 
     async def delete_book(self, book_id: int) -> None:
-        # Находим книгу с зависимостями
-        result = await self.db.execute(
-            select(Book)
-            .options(selectinload(Book.content_blocks))
+        image_url = (await self.db.execute(
+            select(Book.image_url).where(Book.id == book_id)
+        )).one_or_none()
+        if image_url is None:
+            raise HTTPException(404, "Book not found")
+
+        # Выставки с этой книгой узнаём до удаления блоков
+        snapshots = SnapshotService(self.db)
+        exhibition_ids = await snapshots.exhibitions_with_books([book_id])
+
+        # Блоки книги и связи с авторами и жанрами удаляет БД (ON DELETE CASCADE)
+        await self.db.execute(
+            delete(Book)
             .where(Book.id == book_id)
+            .execution_options(synchronize_session=False)
         )
-        book = result.scalar_one_or_none()
+        # Изображение удаляется после COMMIT, если больше ни на что не ссылается
+        await media.release(self.db, image_url[0])
+        await snapshots.refresh(*exhibition_ids)
+        invalidate_on_commit(self.db, f"book:{book_id}")
 
-        if not book:
-            raise HTTPException(404, "Book not found")
+    async def refresh_snapshots(self, book_ids) -> None:
+        """Пересобирает снимки опубликованных выставок с этими книгами."""
+        await SnapshotService(self.db).refresh_for_books(book_ids)
 
-        # Удаляем контент-блоки
-        for block in book.content_blocks:
-            await self.db.delete(block)
+    async def snapshot_exhibitions(self, book_ids) -> List[int]:
+        return await SnapshotService(self.db).exhibitions_with_books(book_ids)
 
-        # Удаляем изображение
-        if book.image_url:
-            filename = book.image_url.split("/")[-1]
-            file_path = self.media_dir / filename
-            try:
-                if file_path.exists():
-                    file_path.unlink()
-            except Exception as e:
-                raise HTTPException(500, f"Failed to delete image: {str(e)}")
+    @staticmethod
+    def author_book_ids(author_id: int):
+        return select(book_authors.c.book_id).where(book_authors.c.author_id == author_id)
 
-        await self.db.delete(book)
+    @staticmethod
+    def genre_book_ids(genre_id: int):
+        return select(book_genres.c.book_id).where(book_genres.c.genre_id == genre_id)
 
-    async def search_authors(self, query: str) -> List[Author]:
-        result = await self.db.execute(
-            select(Author).where(Author.name.ilike(f"%{query}%"))
-        )
-        return result.scalars().all()
+    async def search_authors(self, query: str, limit: int = 20) -> List[dict]:
+        await self._ensure_index(author_index, Author)
+        return author_index.search(query, limit)
 
-    async def search_genres(self, query: str) -> List[Genre]:
-        result = await self.db.execute(
-            select(Genre).where(Genre.name.ilike(f"%{query}%"))
-        )
-        return result.scalars().all()
+    async def search_genres(self, query: str, limit: int = 20) -> List[dict]:
+        await self._ensure_index(genre_index, Genre)
+        return genre_index.search(query, limit)
+
+    async def build_name_indexes(self) -> None:
+        """Полная загрузка индексов автодополнения (при старте приложения)."""
+        for index, model in ((author_index, Author), (genre_index, Genre)):
+            result = await self.db.execute(select(model.id, model.name))
+            index.rebuild(result.all())
+
+    async def _ensure_index(self, index: NameIndex, model) -> None:
+        if index.is_stale:
+            async def load():
+                result = await self.db.execute(select(model.id, model.name))
+                return result.all()
+
+            await index.refresh(load)
 
     async def get_authors(self) -> List[Author]:
-        result = await self.db.execute(select(Author))
+        result = await self.db.execute(select(Author).options(*AUTHOR_OPTION))
         return result.scalars().all()
 
     async def get_genres(self) -> List[Genre]:
-        result = await self.db.execute(select(Genre))
+        result = await self.db.execute(select(Genre).options(*GENRE_OPTION))
         return result.scalars().all()
 
     # Вспомогательные методы
+    def _filtered_query(self, author_id, genre_id, sort_order, search, relevance=True, columns=None):
+        # columns - выбрать колонки вместо объектов Book (строки Core)
+        query = select(*columns) if columns else select(Book).options(*BOOK_CARD)
+
+        if author_id:
+            query = query.filter(Book.authors.any(Author.id.in_(author_id)))
+        
+        if genre_id:
+            query = query.filter(Book.genres.any(Genre.id.in_(genre_id)))
+        
+        score = None
+        if search:
+            query, score = self._apply_search(query, search)
+        
+        # id - второй ключ сортировки, чтобы порядок был однозначным для курсора
+        if sort_order == "asc":
+            query = query.order_by(Book.title.asc(), Book.id.asc())
+            
+        elif sort_order == "desc":
+            query = query.order_by(Book.title.desc(), Book.id.desc())
+
+        elif relevance and score is not None:
+            query = query.order_by(score.desc(), Book.id.asc())
+
+        else:
+            query = query.order_by(Book.id.asc())
+
+        return query
+
+    def _apply_search(self, query, search: str):
+        """
+        Запрос с поиском и выражение релевантности (None, если его нет).
+
+        В MySQL - MATCH ... AGAINST по FULLTEXT-индексам с ngram-парсером:
+        название, аннотация, библиографическое описание и имена авторов.
+        В BOOLEAN MODE каждое слово ищется как ngram-фраза, то есть как
+        подстрока. На прочих диалектах - прежний ilike по названию.
+        """
+        words = [
+            word for word in FULLTEXT_OPERATORS.sub(" ", search).split()
+            if len(word) >= NGRAM_TOKEN_SIZE
+        ]
+        if not words or self.db.get_bind().dialect.name != "mysql":
+            return query.where(Book.title.ilike(f"%{search}%")), None
+
+        against = " ".join(f"+{word}" for word in words)
+        book_match = match(
+            Book.title, Book.annotations, Book.library_description, against=against
+        ).in_boolean_mode()
+        author_match = match(Author.name, against=against).in_boolean_mode()
+
+        # UNION двух индексных поисков вместо OR, который отключил бы FULLTEXT.
+        # JOIN с производной таблицей, а не IN (... UNION ...): подзапрос с UNION
+        # MySQL не превращает в semijoin и проверял бы его для каждой книги
+        matched = union(
+            select(Book.id.label("id")).where(book_match),
+            select(book_authors.c.book_id.label("id"))
+            .join(Author, Author.id == book_authors.c.author_id)
+            .where(author_match),
+        ).subquery("matched")
+        return query.join(matched, matched.c.id == Book.id), book_match
+
+    @staticmethod
+    def _after_cursor(sort_order, cursor):
+        if sort_order == "asc":
+            title, last_id = decode_cursor(cursor, 2)
+            return or_(Book.title > title, and_(Book.title == title, Book.id > last_id))
+        if sort_order == "desc":
+            title, last_id = decode_cursor(cursor, 2)
+            return or_(Book.title < title, and_(Book.title == title, Book.id < last_id))
+        (last_id,) = decode_cursor(cursor, 1)
+        return Book.id > last_id
+
     async def _get_author_by_id(self, author_id: int) -> Author:
         result = await self.db.execute(select(Author).where(Author.id == author_id))
         author = result.scalar_one_or_none()
@@ -178,6 +390,7 @@ class BooksFondsService:
         new_author = Author(name=author_data.name)
         self.db.add(new_author)
         await self.db.flush()
+        invalidate_on_commit(self.db, "authors")
         return new_author
 
     async def create_genre(self, genre_data: GenreCreate) -> Genre:
@@ -187,6 +400,7 @@ class BooksFondsService:
         new_genre = Genre(name=genre_data.name)
         self.db.add(new_genre)
         await self.db.flush()
+        invalidate_on_commit(self.db, "genres")
         return new_genre
 
 
@@ -203,7 +417,7 @@ class BooksContentService:
             raise HTTPException(404, "Content block not found")
             
         # Получаем все книги (оригинальная логика из роутера)
-        result = await self.db.execute(select(Book))
+        result = await self.db.execute(select(Book).options(*BOOK_CARD))
         return result.scalars().all()
 
     async def unlink_book_from_content(self, content_id: int, book_id: int) -> None:
@@ -213,6 +427,7 @@ class BooksContentService:
             raise HTTPException(404, "Content block not found or not linked to this book")
 
         await self.db.delete(content_block)
+        await SnapshotService(self.db).refresh_for_sections(content_block.section_id)
 
     async def get_linked_book(self, content_id: int, book_id: int) -> Book:
         # Проверяем привязку
@@ -238,7 +453,7 @@ class BooksContentService:
 
     async def _get_book_by_id(self, book_id: int) -> Book:
         result = await self.db.execute(
-            select(Book).where(Book.id == book_id))
+            select(Book).options(*BOOK_CARD).where(Book.id == book_id))
         book = result.scalar_one_or_none()
         if not book:
             raise HTTPException(404, "Book not found")
@@ -250,7 +465,7 @@ class AuthorsService:
         self.db = db
 
     async def get_all_authors(self) -> List[Author]:
-        result = await self.db.execute(select(Author))
+        result = await self.db.execute(select(Author).options(*AUTHOR_OPTION))
         return result.scalars().all()
 
     async def create_author(self, author_data: AuthorCreate) -> Author:
@@ -284,7 +499,7 @@ class GenresService:
         self.db = db
 
     async def get_all_genres(self) -> List[Genre]:
-        result = await self.db.execute(select(Genre))
+        result = await self.db.execute(select(Genre).options(*GENRE_OPTION))
         return result.scalars().all()
 
     async def create_genre(self, genre_data: GenreCreate) -> Genre:
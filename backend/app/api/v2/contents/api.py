@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from ....core import get_db
-from ....models import ContentBlock, Section
+from ....core import get_db, get_read_db
+from ....models import ContentBlock, Section, Exhibition
+from ....models.load_plans import EXHIBITION_HEADER
 from .schemas import ContentBlockCreate, ContentBlockResponse, ContentBlockUpdate
 from .services import ContentService
 from ....api.v2.exhibitions.services import ExhibitionService  # импортируем сервис выставок
 from ....core import MEDIA_DIR  # если используется в ExhibitionService
+from ....core.conditional import is_not_modified, not_modified
 
 router = APIRouter(
     prefix="/exhibitions/{exhibition_slug}/sections/{section_id}/content",
@@ -19,10 +22,25 @@ router = APIRouter(
 async def get_section_content(
     exhibition_slug: str,
     section_id: int,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db)
 ):
+    exhibition_service = ExhibitionService(db, MEDIA_DIR)
+    # Версия выставки поднимается при любой записи её блоков
+    validator = await exhibition_service.get_validator(
+        f"content:{section_id}",
+        Exhibition.slug == exhibition_slug,
+        Exhibition.id == select(Section.exhibition_id)
+        .where(Section.id == section_id)
+        .scalar_subquery(),
+    )
+    if is_not_modified(request, validator):
+        return not_modified(validator)
+    validator.apply(response)
+
     # Проверка существования выставки
-    exhibition = await ExhibitionService(db).get_exhibition_by_slug(exhibition_slug)
+    exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
     if not exhibition:
         raise HTTPException(404, "Выставка не найдена")
 
@@ -48,7 +66,7 @@ async def create_content_block(
 ):
     exhibition_service = ExhibitionService(db, MEDIA_DIR)
     try:
-        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug)
+        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
         if not exhibition:
             raise HTTPException(status_code=404, detail="Выставка не найдена")
     except Exception as e:
@@ -58,8 +76,7 @@ async def create_content_block(
     try:
         block = await service.create_content_block(section_id, content_data)
         await db.commit()
-        await db.refresh(block)
-        return block
+        return await service.get_content_block(block.id)
     except HTTPException as he:
         await db.rollback()
         raise he
@@ -77,7 +94,7 @@ async def delete_block(
     db: AsyncSession = Depends(get_db),
 ):
     # Проверка выставки
-    exhibition = await ExhibitionService(db, MEDIA_DIR).get_exhibition_by_slug(exhibition_slug)
+    exhibition = await ExhibitionService(db, MEDIA_DIR).get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
     if not exhibition:
         raise HTTPException(404, "Выставка не найдена")
 
@@ -104,7 +121,7 @@ async def update_content_block(
     db: AsyncSession = Depends(get_db)
 ):
     exhibition_service = ExhibitionService(db, MEDIA_DIR)
-    exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug)
+    exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
     if not exhibition:
         raise HTTPException(status_code=404, detail="Выставка не найдена")
 
@@ -3,7 +3,9 @@ from sqlalchemy import select, func, delete, and_
 from sqlalchemy.orm import selectinload
 from fastapi import HTTPException
 from ....models import ContentBlock, Section, Book
+from ....models.load_plans import CONTENT_BLOCK
 from .schemas import ContentBlockCreate, ContentBlockUpdate
+from ..exhibitions.services import SnapshotService
 from typing import List
 
 
@@ -28,26 +30,34 @@ class ContentService:
         
         for key, value in update_data.items():
             setattr(block, key, value)
-            
+
+        await SnapshotService(self.db).refresh_for_sections(section_id)
         await self.db.commit()
-        await self.db.refresh(block)
-        return block
+        return await self.get_content_block(block.id)
 
     async def get_section_content(self, section_id: int):
         stmt = (
             select(ContentBlock)
-            .options(
-                selectinload(ContentBlock.book).options(
-                    selectinload(Book.authors),
-                    selectinload(Book.genres)
-                )
-            )
+            .options(*CONTENT_BLOCK)
             .where(ContentBlock.section_id == section_id)
         )
         result = await self.db.execute(stmt)
         blocks = result.scalars().all()
         return blocks
 
+    async def get_content_block(self, content_id: int) -> ContentBlock:
+        # populate_existing: book_id мог измениться, а связь book уже загружена
+        result = await self.db.execute(
+            select(ContentBlock)
+            .options(*CONTENT_BLOCK)
+            .where(ContentBlock.id == content_id)
+            .execution_options(populate_existing=True)
+        )
+        block = result.scalar_one_or_none()
+        if not block:
+            raise HTTPException(404, "Content block not found")
+        return block
+
     async def create_content_block(
         self, 
         section_id: int, 
@@ -62,6 +72,7 @@ class ContentService:
         )
         self.db.add(new_block)
         await self.db.flush()
+        await SnapshotService(self.db).refresh_for_sections(section.id)
         return new_block
 
     async def delete_block(self, section_id: int, content_id: int) -> None:
@@ -71,6 +82,7 @@ class ContentService:
         # Получаем и удаляем блок, не трогая книгу
         block = await self._get_validated_block(section_id, content_id)
         await self.db.delete(block)
+        await SnapshotService(self.db).refresh_for_sections(section_id)
 
     # Helper methods
     async def _validate_section(self, section_id: int) -> Section:
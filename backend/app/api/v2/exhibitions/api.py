@@ -1,30 +1,53 @@
 # routers.py
-from fastapi import APIRouter, Depends, UploadFile, Form, Request, Query
+from fastapi import APIRouter, Depends, UploadFile, Form, Request, Query, Response
 from fastapi.exceptions import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from datetime import datetime
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
-from .services import ExhibitionService
-from ....core import get_db, MEDIA_DIR
+from .services import ExhibitionService, SnapshotService
+from ....core import get_db, get_read_db, MEDIA_DIR
+from ....core.response_cache import cached_body, cached_json
+from ....core.serialization import dump_rows
+from ....core.conditional import is_not_modified, not_modified
 from .schemas import (
     ExhibitionBase,
     ExhibitionResponse,
     PaginatedResponse,
-    ExhibitionOut
+    ExhibitionOut,
+    ExhibitionPage,
 )
 from ....models import Exhibition
+from ....models.load_plans import EXHIBITION_TREE
 
 router = APIRouter()
 
+def _exhibition_tags(exhibition: ExhibitionOut) -> list[str]:
+    """Выставка устаревает вместе с любой книгой, автором или жанром в ней."""
+    tags = {f"exhibition:{exhibition.slug}"}
+    for section in exhibition.sections:
+        for block in section.content_blocks:
+            if block.book_id is not None:
+                tags.add(f"book:{block.book_id}")
+            if block.book is not None:
+                tags.update(f"author:{author.id}" for author in block.book.authors)
+                tags.update(f"genre:{genre.id}" for genre in block.book.genres)
+    return list(tags)
+
 @router.get("/exhibitions/", response_model=list[ExhibitionResponse])
 async def get_all_exhibitions(
+    request: Request,
     published: Optional[bool] = None,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     service = ExhibitionService(db, MEDIA_DIR)
-    return await service.get_all_exhibitions(published)
+
+    async def render():
+        # Строки Core сразу в байты, без ORM-объектов и response_model
+        return dump_rows(await service.get_exhibition_cards(published)), ["exhibitions"]
+
+    return await cached_body(request, f"exhibitions:{published}", render)
 
 @router.get("/exhibitionsPage/", response_model=PaginatedResponse[ExhibitionResponse])
 async def get_page_exhibition(
@@ -34,7 +57,11 @@ async def get_page_exhibition(
     search: Optional[str] = None,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
-    db: AsyncSession = Depends(get_db)
+    cursor: Optional[str] = Query(
+        None, description="Keyset-режим: пустое значение - первая страница, далее next_cursor"
+    ),
+    with_total: bool = Query(True, description="Считать total/total_pages"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     service = ExhibitionService(db, MEDIA_DIR)
     return await service.get_paginated_exhibitions(
@@ -43,19 +70,53 @@ async def get_page_exhibition(
         size=size,
         search=search,
         date_from=date_from,
-        date_to=date_to
+        date_to=date_to,
+        cursor=cursor,
+        with_total=with_total,
     )
 
+@router.get("/exhibitions/{slug}/page", response_model=ExhibitionPage)
+async def get_exhibition_page(
+    slug: str,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Вся страница выставки: разделы, блоки и таблица книг одним ответом."""
+    # Опубликованные выставки отдаются из готового снимка одним SELECT
+    document = await SnapshotService(db).get_document(slug)
+    if document is not None:
+        return Response(content=document, media_type="application/json")
+    service = ExhibitionService(db, MEDIA_DIR)
+    return await service.get_exhibition_page(slug)
+
 @router.get("/exhibitions/{identifier}", response_model=ExhibitionOut)
 async def get_exhibition(
+    request: Request,
     identifier: str | int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     service = ExhibitionService(db, MEDIA_DIR)
+    by_id = isinstance(identifier, int) or identifier.isdigit()
+
+    async def load():
+        if by_id:
+            return await service.get_exhibition_by_id(int(identifier), EXHIBITION_TREE)
+        return await service.get_exhibition_by_slug(identifier, EXHIBITION_TREE)
+
     try:
-        if isinstance(identifier, int) or identifier.isdigit():
-            return await service.get_exhibition_by_id(int(identifier))
-        return await service.get_exhibition_by_slug(identifier)
+        validator = await service.get_validator(
+            "exhibition",
+            Exhibition.id == int(identifier) if by_id else Exhibition.slug == identifier,
+        )
+        if is_not_modified(request, validator):
+            return not_modified(validator)
+        response = await cached_json(
+            request,
+            f"exhibition:{identifier}:{validator.etag}",
+            ExhibitionOut,
+            load,
+            _exhibition_tags,
+        )
+        return validator.apply(response)
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -85,10 +146,7 @@ async def create_exhibition(
         
         stmt = (
             select(Exhibition)
-            .options(
-                selectinload(Exhibition.sections),
-                selectinload(Exhibition.author)
-            )
+            .options(*EXHIBITION_TREE)
             .where(Exhibition.id == exhibition.id)
         )
         result = await db.execute(stmt)
@@ -101,6 +159,29 @@ async def create_exhibition(
         await db.rollback()
         raise HTTPException(500, str(e))
 
+@router.post("/exhibitions/{exhibition_id}/clone", response_model=ExhibitionOut)
+async def clone_exhibition(
+    exhibition_id: int,
+    request: Request,
+    title: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Черновик-копия выставки с разделами и блоками; книги и изображение общие."""
+    user_id = request.session.get("user_id")
+    author_id = int(user_id) if user_id else None
+
+    service = ExhibitionService(db, MEDIA_DIR)
+    try:
+        clone_id = await service.clone_exhibition(exhibition_id, title, author_id)
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(500, str(e))
+    return await service.get_exhibition_by_id(clone_id, EXHIBITION_TREE)
+
 @router.put("/exhibitions/{identifier}", response_model=ExhibitionOut)
 async def update_exhibition(
     identifier: int,
@@ -5,8 +5,13 @@ from pydantic.generics import GenericModel
 from fastapi import UploadFile, Form, File
 from datetime import datetime
 from ....models import User
-from ....core import ALLOWED_MIME_TYPES, MAX_FILE_SIZE
+from ....core import ALLOWED_MIME_TYPES
 from ..sections.schemas import SectionResponse
+from ..books.schemas import BookResponse
+
+
+# Подпись автора выставки, если полное имя не заполнено
+NO_AUTHOR_NAME = "Пользователь не ввел свое полное имя"
 
 
 class ExhibitionResponse(BaseModel):
@@ -26,7 +31,7 @@ class ExhibitionResponse(BaseModel):
     def set_author(cls, author_obj):
         if author_obj and author_obj.fullname:
             return author_obj.fullname
-        return "Пользователь не ввел свое полное имя"
+        return NO_AUTHOR_NAME
 
 
 T = TypeVar("T")
@@ -35,8 +40,11 @@ class PaginatedResponse(GenericModel, Generic[T]):
     items: List[T]
     page: int
     size: int
-    total: int
-    total_pages: int
+    # None, если клиент отказался от подсчёта (with_total=false)
+    total: Optional[int] = None
+    total_pages: Optional[int] = None
+    # Курсор следующей страницы в keyset-режиме; None - страниц больше нет
+    next_cursor: Optional[str] = None
 
 class ExhibitionBase(BaseModel):
     title: str
@@ -49,18 +57,10 @@ class ExhibitionBase(BaseModel):
         if v is None:
             return v
             
-        # Проверка MIME-типа
+        # Проверка MIME-типа; размер и сигнатуру проверяет media.store_upload
         if v.content_type not in ALLOWED_MIME_TYPES:
             raise ValueError(f"Недопустимый формат: {v.content_type}")
-        
-        # Получение реального размера файла
-        v.file.seek(0, 2)  # Перемещаем указатель в конец файла
-        file_size = v.file.tell()
-        v.file.seek(0)  # Возвращаем указатель в начало
-        
-        if file_size > MAX_FILE_SIZE:
-            raise ValueError(f"Файл слишком большой: {file_size/1024/1024:.2f} MB")
-        
+
         return v
 
     @classmethod
@@ -95,4 +95,33 @@ class ExhibitionOut(BaseModel):
     def set_author(cls, author_obj):
         if author_obj and author_obj.fullname:
             return author_obj.fullname
-        return "Пользователь не ввел свое полное имя"
\ No newline at end of file
+        return NO_AUTHOR_NAME
+
+
+# Страница выставки одним запросом: книги вынесены в отдельную таблицу
+# books и встречаются в ответе один раз, блоки ссылаются на них по book_id
+class PageContentBlock(BaseModel):
+    id: int
+    type: str
+    text_content: Optional[str]
+    book_id: Optional[int]
+
+
+class PageSection(BaseModel):
+    id: int
+    title: str
+    content_blocks: List[PageContentBlock] = []
+
+
+class ExhibitionPage(BaseModel):
+    id: int
+    title: str
+    slug: str
+    description: Optional[str]
+    is_published: bool
+    image: Optional[str]
+    author: str
+    created_at: datetime
+    published_at: Optional[datetime] = None
+    sections: List[PageSection] = []
+    books: List[BookResponse] = []
@@ -1,96 +1,242 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete
+from sqlalchemy import select, func, delete, insert, and_, or_, case, false, literal, null
 from sqlalchemy.orm import selectinload
 from pathlib import Path
 from typing import Optional, List
-import uuid
-import aiofiles
 import asyncio
 from datetime import datetime, timezone
 from fastapi import HTTPException, UploadFile
 from slugify import slugify
-from ....models import Exhibition, Section
-from .schemas import ExhibitionBase, PaginatedResponse
+from ....models import (
+    Exhibition,
+    ExhibitionSnapshot,
+    Section,
+    ContentBlock,
+    Book,
+    Author,
+    Genre,
+    User,
+)
+from ....models.books import book_authors, book_genres
+from ....models.load_plans import EXHIBITION_HEADER, EXHIBITION_TREE
+from ....core.pagination import encode_cursor, decode_cursor
+from ....core.response_cache import invalidate_on_commit, response_cache
+from ....core.conditional import Validator, make_validator, touch
+from ....core import media
+from .schemas import ExhibitionBase, PaginatedResponse, ExhibitionPage, NO_AUTHOR_NAME
+
+
+# Колонки ExhibitionResponse в порядке полей схемы (автор - из User.fullname)
+EXHIBITION_CARD_COLUMNS = (
+    Exhibition.id,
+    Exhibition.title,
+    Exhibition.slug,
+    Exhibition.description,
+    Exhibition.is_published,
+    Exhibition.image,
+    Exhibition.created_at,
+    Exhibition.published_at,
+)
+
+# COUNT(*) для пагинации хранится в общем кэше ответов под тегом "exhibitions":
+# ограничен по размеру и TTL, сбрасывается после COMMIT любой записи выставок
+COUNT_CACHE_PREFIX = "exhibitions:count:"
+
+
+def _exhibition_cursor(exhibition: Exhibition) -> str:
+    published_at = exhibition.published_at
+    return encode_cursor(published_at.isoformat() if published_at else None, exhibition.id)
+
+
+def _decode_exhibition_cursor(cursor: str):
+    published_at, exhibition_id = decode_cursor(cursor, 2)
+    try:
+        return (
+            datetime.fromisoformat(published_at) if published_at else None,
+            int(exhibition_id),
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
 
 class ExhibitionService:
     def __init__(self, db: AsyncSession, media_dir: Path):
         self.db = db
         self.media_dir = media_dir
 
-    async def get_all_exhibitions(self, published: Optional[bool]) -> List[Exhibition]:
+    async def get_exhibition_cards(self, published: Optional[bool]) -> List[dict]:
+        """
+        Карточки выставок (ExhibitionResponse) словарями из строк Core:
+        один запрос с JOIN автора, для serialization.dump_rows.
+        """
         query = (
-            select(Exhibition)
-            .options(selectinload(Exhibition.author))
+            select(*EXHIBITION_CARD_COLUMNS, User.fullname)
+            .outerjoin(User, User.id == Exhibition.author_id)
+            .order_by(Exhibition.id)
         )
         if published is not None:
             query = query.where(Exhibition.is_published == published)
-        result = await self.db.execute(query)
-        return result.scalars().all()
+        cards = []
+        for row in await self.db.execute(query):
+            card = {"id": row.id, "sections": []}
+            card.update(row._asdict())
+            card["author"] = card.pop("fullname") or NO_AUTHOR_NAME
+            cards.append(card)
+        return cards
 
-    async def get_paginated_exhibitions(self, published, page, size, search: str = None, date_from: datetime = None, date_to: datetime = None):
+    async def get_paginated_exhibitions(
+        self,
+        published,
+        page,
+        size,
+        search: str = None,
+        date_from: datetime = None,
+        date_to: datetime = None,
+        cursor: Optional[str] = None,
+        with_total: bool = True,
+    ):
         query = (
             select(Exhibition)
-            .options(
-                selectinload(Exhibition.author),
-                selectinload(Exhibition.sections)
-        )
-            .where((Exhibition.is_published == published) if published is not None else True)
-        )
-        
-        # Добавляем фильтрацию по поиску
-        if search:
-            query = query.where(Exhibition.title.ilike(f"%{search}%"))
-        
-        # Добавляем фильтрацию по дате
-        if date_from:
-            query = query.where(Exhibition.published_at >= date_from)
-        if date_to:
-            query = query.where(Exhibition.published_at <= date_to)
-        
-        # Остальной код остается прежним
-        query = query.offset((page - 1) * size).limit(size)
-        result = await self.db.execute(query)
-        exhibitions = result.scalars().all()
-        
-        # Обновляем подсчет с учетом фильтров
-        count_query = select(func.count(Exhibition.id)).where(
-            (Exhibition.is_published == published) if published is not None else True
+            .options(*EXHIBITION_HEADER)
+            .order_by(Exhibition.published_at.desc(), Exhibition.id.desc())
         )
-        if search:
-            count_query = count_query.where(Exhibition.title.ilike(f"%{search}%"))
-        if date_from:
-            count_query = count_query.where(Exhibition.published_at >= date_from)
-        if date_to:
-            count_query = count_query.where(Exhibition.published_at <= date_to)
-        
-        total = await self.db.scalar(count_query)
-        total_pages = (total + size - 1) // size if total else 0
-        
+        query = self._apply_filters(query, published, search, date_from, date_to)
+
+        next_cursor = None
+        if cursor is None:
+            # Старый режим page/size
+            query = query.offset((page - 1) * size).limit(size)
+            result = await self.db.execute(query)
+            exhibitions = result.scalars().all()
+        else:
+            # Keyset-режим: продолжаем после последней строки прошлой страницы
+            if cursor:
+                query = query.where(self._after_cursor(_decode_exhibition_cursor(cursor)))
+            result = await self.db.execute(query.limit(size + 1))
+            exhibitions = result.scalars().all()
+            if len(exhibitions) > size:
+                exhibitions = exhibitions[:size]
+                next_cursor = _exhibition_cursor(exhibitions[-1])
+
+        total = total_pages = None
+        if with_total:
+            total = await self._count_exhibitions(published, search, date_from, date_to)
+            total_pages = (total + size - 1) // size if total else 0
+
         return {
             "items": exhibitions,
             "total": total,
             "page": page,
             "size": size,
             "total_pages": total_pages,
+            "next_cursor": next_cursor,
+        }
+
+    async def get_exhibition_page(self, slug: str) -> dict:
+        """
+        Дерево страницы выставки фиксированным числом запросов (6), сколько
+        бы ни было разделов: выставка, разделы, блоки, книги, авторы, жанры.
+        Читаются строки Core без ORM-объектов.
+        """
+        row = (await self.db.execute(
+            select(Exhibition.__table__, User.fullname)
+            .outerjoin(User, User.id == Exhibition.author_id)
+            .where(Exhibition.slug == slug)
+        )).mappings().one_or_none()
+        if row is None:
+            raise HTTPException(404, "Exhibition not found")
+
+        sections = (await self.db.execute(
+            select(Section.id, Section.title)
+            .where(Section.exhibition_id == row["id"])
+            .order_by(Section.id)
+        )).mappings().all()
+
+        blocks = (await self.db.execute(
+            select(
+                ContentBlock.id,
+                ContentBlock.section_id,
+                ContentBlock.type,
+                ContentBlock.text_content,
+                ContentBlock.book_id,
+            )
+            .join(Section, Section.id == ContentBlock.section_id)
+            .where(Section.exhibition_id == row["id"])
+            .order_by(ContentBlock.id)
+        )).mappings().all()
+
+        blocks_by_section = {section["id"]: [] for section in sections}
+        book_ids = set()
+        for block in blocks:
+            blocks_by_section[block["section_id"]].append({
+                "id": block["id"],
+                "type": block["type"].value,
+                "text_content": block["text_content"],
+                "book_id": block["book_id"],
+            })
+            if block["book_id"] is not None:
+                book_ids.add(block["book_id"])
+
+        return {
+            **{key: row[key] for key in (
+                "id", "title", "slug", "description", "is_published",
+                "image", "created_at", "published_at",
+            )},
+            "author": row["fullname"] or NO_AUTHOR_NAME,
+            "sections": [
+                {**section, "content_blocks": blocks_by_section[section["id"]]}
+                for section in sections
+            ],
+            "books": await self._load_books(book_ids),
         }
 
-    async def get_exhibition_by_slug(self, slug: str) -> Exhibition:
+    async def get_validator(self, resource: str, *where) -> Validator:
+        """
+        ETag выставки одним запросом: версия выставки (её поднимают записи
+        разделов и блоков), версии книг в блоках и имя автора выставки.
+        """
+        row = (await self.db.execute(
+            select(
+                Exhibition.id,
+                Exhibition.version,
+                Exhibition.updated_at,
+                User.fullname,
+                func.count(Book.id),
+                func.coalesce(func.sum(Book.version), 0),
+                func.max(Book.updated_at),
+            )
+            .outerjoin(User, User.id == Exhibition.author_id)
+            .outerjoin(Section, Section.exhibition_id == Exhibition.id)
+            .outerjoin(ContentBlock, ContentBlock.section_id == Section.id)
+            .outerjoin(Book, Book.id == ContentBlock.book_id)
+            .where(*where)
+            .group_by(Exhibition.id, User.fullname)
+        )).one_or_none()
+        if row is None:
+            raise HTTPException(404, "Exhibition not found")
+        exhibition_id, version, updated_at, fullname, books, book_versions, books_updated_at = row
+        return make_validator(
+            resource,
+            (exhibition_id, version, fullname, books, book_versions),
+            updated_at,
+            books_updated_at,
+        )
+
+    async def get_exhibition_by_slug(self, slug: str, load_plan) -> Exhibition:
+        # load_plan - EXHIBITION_HEADER или EXHIBITION_TREE из models/load_plans.py
         result = await self.db.execute(
             select(Exhibition)
-            .options(selectinload(Exhibition.author))
+            .options(*load_plan)
             .where(Exhibition.slug == slug)
         )
         if exhibition := result.scalar_one_or_none():
             return exhibition
         raise HTTPException(404, "Exhibition not found")
 
-    async def get_exhibition_by_id(self, exhibition_id: int) -> Exhibition:
+    async def get_exhibition_by_id(self, exhibition_id: int, load_plan) -> Exhibition:
         stmt = (
             select(Exhibition)
-            .options(
-                selectinload(Exhibition.author),
-                selectinload(Exhibition.sections)   
-            )
+            .options(*load_plan)
             .where(Exhibition.id == exhibition_id)
         )
         result = await self.db.execute(stmt)
@@ -111,7 +257,7 @@ class ExhibitionService:
         exhibition = Exhibition(
             **data.dict(exclude={'image'}),
             slug=slug,
-            image=f"/picture/{filename}",
+            image=media.media_url(filename),
             created_at=datetime.now(timezone.utc),
             published_at=datetime.now(timezone.utc) 
             if data.is_published else None,
@@ -120,6 +266,8 @@ class ExhibitionService:
         
         self.db.add(exhibition)
         await self.db.flush()
+        await SnapshotService(self.db).refresh(exhibition.id)
+        invalidate_on_commit(self.db, "exhibitions")
         return exhibition
 
     async def update_exhibition(
@@ -130,15 +278,18 @@ class ExhibitionService:
     ) -> Exhibition:
         # Get existing exhibition
         if isinstance(identifier, int):
-            exhibition = await self.get_exhibition_by_id(identifier)
+            exhibition = await self.get_exhibition_by_id(identifier, EXHIBITION_TREE)
         else:
-            exhibition = await self.get_exhibition_by_slug(identifier)
+            exhibition = await self.get_exhibition_by_slug(identifier, EXHIBITION_TREE)
+        # Старый слаг: закэшированная страница по нему тоже устарела
+        invalidate_on_commit(self.db, "exhibitions", f"exhibition:{exhibition.slug}")
 
         # Update image if provided
         if image:
-            await self._delete_old_image(exhibition.image)
+            old_image = exhibition.image
             filename = await self._save_image(image)
-            exhibition.image = f"/picture/{filename}"
+            exhibition.image = media.media_url(filename)
+            await self._delete_old_image(old_image)
 
         # Update other fields
         exhibition.title = data.title
@@ -153,33 +304,274 @@ class ExhibitionService:
             exhibition.published_at = None
 
         await self.db.flush()
+        await SnapshotService(self.db).refresh(exhibition.id)
         return exhibition
 
     async def delete_exhibition(self, exhibition_id: int) -> None:
-        exhibition = await self.get_exhibition_by_id(exhibition_id)
-        await self.db.delete(exhibition)
-        await self._delete_old_image(exhibition.image)
+        # Один DELETE: разделы, блоки и снимок удаляет БД (ON DELETE CASCADE),
+        # число запросов не зависит от размера выставки
+        row = (await self.db.execute(
+            select(Exhibition.slug, Exhibition.image).where(Exhibition.id == exhibition_id)
+        )).one_or_none()
+        if row is None:
+            raise HTTPException(404, "Exhibition not found")
+        invalidate_on_commit(self.db, "exhibitions", f"exhibition:{row.slug}")
+        await self.db.execute(
+            delete(Exhibition)
+            .where(Exhibition.id == exhibition_id)
+            .execution_options(synchronize_session=False)
+        )
+        await self._delete_old_image(row.image)
+
+    async def clone_exhibition(
+        self, exhibition_id: int, title: Optional[str] = None, author_id: Optional[int] = None
+    ) -> int:
+        """
+        Копия выставки с разделами и блоками тремя INSERT ... SELECT, без
+        загрузки строк в Python. Книги и файл изображения общие (image -
+        тот же URL, файл живёт, пока на него ссылается хоть одна выставка).
+        Копия создаётся неопубликованной; slug - свободный вариант от title.
+        """
+        source = (await self.db.execute(
+            select(Exhibition.title).where(Exhibition.id == exhibition_id)
+        )).one_or_none()
+        if source is None:
+            raise HTTPException(404, "Exhibition not found")
+        title = title or f"{source.title} (копия)"
+        slug = await self._unique_slug(slugify(title))
+
+        exhibitions = Exhibition.__table__
+        await self.db.execute(
+            insert(exhibitions).from_select(
+                ["title", "slug", "is_published", "image", "description", "created_at", "published_at", "author_id"],
+                select(
+                    literal(title), literal(slug), false(), exhibitions.c.image, exhibitions.c.description,
+                    func.now(), null(), literal(author_id) if author_id is not None else null(),
+                ).where(exhibitions.c.id == exhibition_id),
+            )
+        )
+        clone_id = await self.db.scalar(select(Exhibition.id).where(Exhibition.slug == slug))
+
+        sections = Section.__table__
+        await self.db.execute(
+            insert(sections).from_select(
+                ["title", "exhibition_id"],
+                select(sections.c.title, literal(clone_id))
+                .where(sections.c.exhibition_id == exhibition_id)
+                .order_by(sections.c.id),
+            )
+        )
+        # Новые id выдаются по возрастанию в порядке SELECT: i-й старый раздел -> i-й новый
+        old_ids = await self._section_ids(exhibition_id)
+        new_ids = await self._section_ids(clone_id)
+        if old_ids:
+            blocks = ContentBlock.__table__
+            await self.db.execute(
+                insert(blocks).from_select(
+                    ["type", "text_content", "book_id", "section_id"],
+                    select(
+                        blocks.c.type, blocks.c.text_content, blocks.c.book_id,
+                        case(dict(zip(old_ids, new_ids)), value=blocks.c.section_id),
+                    )
+                    .where(blocks.c.section_id.in_(old_ids))
+                    .order_by(blocks.c.id),
+                )
+            )
+
+        await SnapshotService(self.db).refresh(clone_id)
+        invalidate_on_commit(self.db, "exhibitions")
+        return clone_id
 
     # Helpers
+    async def _load_books(self, book_ids) -> List[dict]:
+        """Книги с авторами и жанрами: три запроса на любой набор id."""
+        if not book_ids:
+            return []
+        books = (await self.db.execute(
+            select(
+                Book.id,
+                Book.title,
+                Book.annotations,
+                Book.library_description,
+                Book.image_url,
+                Book.year_of_publication,
+            )
+            .where(Book.id.in_(book_ids))
+            .order_by(Book.id)
+        )).mappings().all()
+
+        authors = (await self.db.execute(
+            select(book_authors.c.book_id, Author.id, Author.name)
+            .join(Author, Author.id == book_authors.c.author_id)
+            .where(book_authors.c.book_id.in_(book_ids))
+        )).all()
+        genres = (await self.db.execute(
+            select(book_genres.c.book_id, Genre.id, Genre.name)
+            .join(Genre, Genre.id == book_genres.c.genre_id)
+            .where(book_genres.c.book_id.in_(book_ids))
+        )).all()
+
+        result = {book["id"]: {**book, "authors": [], "genres": []} for book in books}
+        for key, rows in (("authors", authors), ("genres", genres)):
+            seen = set()
+            for book_id, item_id, name in rows:
+                # У таблиц связей нет уникального ключа; как в BooksFondsService._attach_names
+                if (book_id, item_id) not in seen:
+                    seen.add((book_id, item_id))
+                    result[book_id][key].append({"id": item_id, "name": name})
+        return list(result.values())
+
+    @staticmethod
+    def _apply_filters(query, published, search, date_from, date_to):
+        if published is not None:
+            query = query.where(Exhibition.is_published == published)
+        if search:
+            query = query.where(Exhibition.title.ilike(f"%{search}%"))
+        if date_from:
+            query = query.where(Exhibition.published_at >= date_from)
+        if date_to:
+            query = query.where(Exhibition.published_at <= date_to)
+        return query
+
+    @staticmethod
+    def _after_cursor(position):
+        # Порядок (published_at DESC, id DESC); NULL в MySQL идут последними.
+        # Условие раскрыто через OR, чтобы MySQL шёл по индексу диапазоном.
+        published_at, last_id = position
+        if published_at is None:
+            return and_(Exhibition.published_at.is_(None), Exhibition.id < last_id)
+        return or_(
+            Exhibition.published_at < published_at,
+            and_(Exhibition.published_at == published_at, Exhibition.id < last_id),
+            Exhibition.published_at.is_(None),
+        )
+
+    async def _count_exhibitions(self, published, search, date_from, date_to) -> int:
+        key = f"{COUNT_CACHE_PREFIX}{published}:{date_from}:{date_to}:{search}"
+        cached = response_cache.get(key)
+        if cached is not None:
+            return int(cached)
+        # Счёт, начатый до чужого COMMIT, в кэш не попадёт (см. ResponseCache.generation)
+        generation = response_cache.generation
+        count_query = self._apply_filters(
+            select(func.count(Exhibition.id)), published, search, date_from, date_to
+        )
+        total = await self.db.scalar(count_query)
+        response_cache.set(key, str(total).encode(), ("exhibitions",), generation)
+        return total
+
+    async def _section_ids(self, exhibition_id: int) -> List[int]:
+        result = await self.db.execute(
+            select(Section.id).where(Section.exhibition_id == exhibition_id).order_by(Section.id)
+        )
+        return list(result.scalars())
+
+    async def _unique_slug(self, base: str) -> str:
+        """base, а если занят - первый свободный base-2, base-3, ... (один запрос)."""
+        taken = set((await self.db.execute(
+            select(Exhibition.slug).where(or_(Exhibition.slug == base, Exhibition.slug.like(f"{base}-%")))
+        )).scalars())
+        slug, n = base, 1
+        while slug in taken:
+            n += 1
+            slug = f"{base}-{n}"
+        return slug
+
     async def _is_slug_exists(self, slug: str) -> bool:
         result = await self.db.execute(
             select(Exhibition).where(Exhibition.slug == slug))
         return result.scalar_one_or_none() is not None
 
     async def _save_image(self, image: UploadFile) -> str:
-        file_ext = image.filename.split('.')[-1]
-        filename = f"{uuid.uuid4()}.{file_ext}"
-        file_path = self.media_dir / filename
-        
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(await image.read())
-            
-        return filename
+        return await media.store_upload(image)
 
     async def _delete_old_image(self, image_path: str) -> None:
-        if not image_path:
-            return
-        filename = image_path.split('/')[-1]
-        file_path = self.media_dir / filename
-        if file_path.exists():
-            file_path.unlink()
\ No newline at end of file
+        # Файл удаляется после COMMIT, если на него больше никто не ссылается
+        await media.release(self.db, image_path)
+
+class SnapshotService:
+    """
+    Снимки страниц опубликованных выставок (готовый JSON ExhibitionPage).
+
+    Снимок пересобирается в той же транзакции, что и запись, которая его
+    затронула, поэтому публичное чтение - один SELECT без ORM-объектов.
+    У неопубликованных выставок снимка нет, их страница строится на лету.
+    """
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_document(self, slug: str) -> Optional[str]:
+        return await self.db.scalar(
+            select(ExhibitionSnapshot.document)
+            .join(Exhibition, Exhibition.id == ExhibitionSnapshot.exhibition_id)
+            .where(Exhibition.slug == slug)
+        )
+
+    async def refresh(self, *exhibition_ids: int) -> None:
+        """Пересобирает снимки выставок; снятые с публикации теряют снимок."""
+        await self.db.flush()
+        if exhibition_ids:
+            # Версия выставки для ETag: здесь проходят все записи её содержимого
+            await touch(self.db, Exhibition, exhibition_ids)
+        pages = ExhibitionService(self.db, None)
+        for exhibition_id in set(exhibition_ids):
+            await self.db.execute(
+                delete(ExhibitionSnapshot)
+                .where(ExhibitionSnapshot.exhibition_id == exhibition_id)
+            )
+            row = (await self.db.execute(
+                select(Exhibition.slug, Exhibition.is_published)
+                .where(Exhibition.id == exhibition_id)
+            )).one_or_none()
+            if row is None:
+                continue
+            # Через refresh проходят все записи разделов и блоков выставки
+            invalidate_on_commit(self.db, f"exhibition:{row.slug}")
+            if not row.is_published:
+                continue
+            page = await pages.get_exhibition_page(row.slug)
+            await self.db.execute(insert(ExhibitionSnapshot).values(
+                exhibition_id=exhibition_id,
+                document=ExhibitionPage.model_validate(page).model_dump_json(),
+                built_at=datetime.now(timezone.utc),
+            ))
+
+    async def refresh_for_sections(self, *section_ids: int) -> None:
+        await self.db.flush()
+        result = await self.db.execute(
+            select(Section.exhibition_id).distinct()
+            .where(Section.id.in_(section_ids))
+        )
+        await self.refresh(*result.scalars().all())
+
+    async def refresh_for_books(self, book_ids) -> None:
+        """book_ids - список id или подзапрос (например, книги автора)."""
+        await self.db.flush()
+        result = await self.db.execute(
+            select(Section.exhibition_id).distinct()
+            .join(ContentBlock, ContentBlock.section_id == Section.id)
+            .join(Exhibition, Exhibition.id == Section.exhibition_id)
+            .where(
+                ContentBlock.book_id.in_(book_ids),
+                Exhibition.is_published.is_(True),
+            )
+        )
+        await self.refresh(*result.scalars().all())
+
+    async def exhibitions_with_books(self, book_ids) -> List[int]:
+        """Выставки, ссылающиеся на книги: нужно узнать до удаления блоков."""
+        result = await self.db.execute(
+            select(Section.exhibition_id).distinct()
+            .join(ContentBlock, ContentBlock.section_id == Section.id)
+            .where(ContentBlock.book_id.in_(book_ids))
+        )
+        return list(result.scalars().all())
+
+    async def rebuild_all(self) -> int:
+        await self.db.execute(delete(ExhibitionSnapshot))
+        result = await self.db.execute(
+            select(Exhibition.id).where(Exhibition.is_published.is_(True))
+        )
+        exhibition_ids = result.scalars().all()
+        await self.refresh(*exhibition_ids)
+        return len(exhibition_ids)
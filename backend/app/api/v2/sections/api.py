@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from ....core import get_db, MEDIA_DIR  # убедитесь, что MEDIA_DIR импортируется отсюда
-from ..sections.schemas import SectionResponse, SectionCreate
+from ....core import get_db, get_read_db, MEDIA_DIR  # убедитесь, что MEDIA_DIR импортируется отсюда
+from ..sections.schemas import SectionResponse, SectionCreate, BatchRequest, BatchResponse
 from .services import SectionService
 from ..exhibitions.services import ExhibitionService  # импорт сервиса для выставок
+from ....core.conditional import is_not_modified, not_modified
+from ....models import Exhibition
+from ....models.load_plans import EXHIBITION_HEADER
 
 router = APIRouter(prefix="/exhibitions/{exhibition_slug}")
 
@@ -12,12 +15,20 @@ router = APIRouter(prefix="/exhibitions/{exhibition_slug}")
 @router.get("/sections/", response_model=List[SectionResponse])
 async def get_exhibition_sections(
     exhibition_slug: str, 
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db)
 ):
     # Создаем сервис выставок, передавая media_dir
     exhibition_service = ExhibitionService(db, MEDIA_DIR)
+    validator = await exhibition_service.get_validator(
+        "sections", Exhibition.slug == exhibition_slug
+    )
+    if is_not_modified(request, validator):
+        return not_modified(validator)
+    validator.apply(response)
     try:
-        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug)
+        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
         if not exhibition:
             raise HTTPException(404, "Выставка не найдена")
     except HTTPException as he:
@@ -45,7 +56,7 @@ async def update_section(
 ):
     exhibition_service = ExhibitionService(db, MEDIA_DIR)
     try:
-        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug)
+        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
         if not exhibition:
             raise HTTPException(404, "Выставка не найдена")
     except HTTPException:
@@ -59,8 +70,7 @@ async def update_section(
             exhibition.id, section_id, section_data
         )
         await db.commit()
-        await db.refresh(updated)
-        return updated
+        return await service.get_section(updated.id)
     except HTTPException:
         await db.rollback()
         raise
@@ -79,7 +89,7 @@ async def create_section(
     # Создаем сервис выставок с media_dir
     exhibition_service = ExhibitionService(db, MEDIA_DIR)
     try:
-        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug)
+        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
         if not exhibition:
             raise HTTPException(404, "Выставка не найдена")
     except HTTPException as he:
@@ -91,8 +101,7 @@ async def create_section(
     try:
         section = await service.create_section(exhibition.id, section_data)
         await db.commit()
-        await db.refresh(section)
-        return section
+        return await service.get_section(section.id)
     except HTTPException as he:
         await db.rollback()
         raise he
@@ -100,6 +109,37 @@ async def create_section(
         await db.rollback()
         raise HTTPException(500, str(e))
 
+# Пакет правок разделов и блоков: одна проверка, одна транзакция
+@router.post("/sections/batch/", response_model=BatchResponse)
+async def apply_sections_batch(
+    exhibition_slug: str,
+    batch: BatchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Операции create/update/delete для разделов и блоков по порядку списка.
+    Ошибка в любой операции - ничего не меняется; в ответе разделы выставки
+    после пакета и id разделов, созданных с ref.
+    """
+    exhibition = await ExhibitionService(db, MEDIA_DIR).get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
+    # После пакета загруженные объекты сессии сброшены (expire_all)
+    exhibition_id = exhibition.id
+
+    service = SectionService(db)
+    try:
+        created = await service.apply_batch(exhibition_id, batch.operations)
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(500, str(e))
+    return {
+        "created_sections": created,
+        "sections": await service.get_exhibition_sections(exhibition_id),
+    }
+
 # Удаление раздела через slug выставки
 @router.delete("/sections/{section_id}")
 async def delete_section(
@@ -110,7 +150,7 @@ async def delete_section(
     # Создаем сервис выставок с media_dir
     exhibition_service = ExhibitionService(db, MEDIA_DIR)
     try:
-        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug)
+        exhibition = await exhibition_service.get_exhibition_by_slug(exhibition_slug, EXHIBITION_HEADER)
         if not exhibition:
             raise HTTPException(404, "Выставка не найдена")
     except HTTPException as he:
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict, Field
-from typing import Optional, List
-from ..contents.schemas import ContentBlockResponse
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import Annotated, Dict, Literal, Optional, List, Union
+from ..contents.schemas import ContentBlockCreate, ContentBlockResponse, ContentBlockUpdate
 
 
 class SectionResponse(BaseModel):
@@ -13,3 +13,65 @@ class SectionResponse(BaseModel):
 
 class SectionCreate(BaseModel):
     title: str
+
+
+# Пакетное редактирование: операции применяются по порядку в одной транзакции
+class SectionCreateOperation(SectionCreate):
+    op: Literal["create_section"]
+    # Имя, по которому create_block этого же пакета ссылается на новый раздел
+    ref: Optional[str] = None
+
+
+class SectionUpdateOperation(SectionCreate):
+    op: Literal["update_section"]
+    section_id: int
+
+
+class SectionDeleteOperation(BaseModel):
+    op: Literal["delete_section"]
+    section_id: int
+
+
+class BlockCreateOperation(ContentBlockCreate):
+    op: Literal["create_block"]
+    section_id: Optional[int] = None
+    section_ref: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_section(self):
+        if (self.section_id is None) == (self.section_ref is None):
+            raise ValueError("either section_id or section_ref required")
+        return self
+
+
+class BlockUpdateOperation(ContentBlockUpdate):
+    op: Literal["update_block"]
+    block_id: int
+
+
+class BlockDeleteOperation(BaseModel):
+    op: Literal["delete_block"]
+    block_id: int
+
+
+BatchOperation = Annotated[
+    Union[
+        SectionCreateOperation,
+        SectionUpdateOperation,
+        SectionDeleteOperation,
+        BlockCreateOperation,
+        BlockUpdateOperation,
+        BlockDeleteOperation,
+    ],
+    Field(discriminator="op"),
+]
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=1000)
+
+
+class BatchResponse(BaseModel):
+    # ref -> id созданного раздела
+    created_sections: Dict[str, int] = {}
+    sections: List[SectionResponse]
@@ -1,9 +1,17 @@
 # services/section.py
+from collections import defaultdict
+from typing import Dict, List
+
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, bindparam, delete, insert, update
 from fastapi import HTTPException
-from ....models import Exhibition, Section
-from ..sections.schemas import SectionCreate
+from ....models import Book, ContentBlock, Exhibition, Section
+from ....models.contentblocks import ContentBlockType
+from ....models.load_plans import SECTION_TREE
+from ..sections.schemas import SectionCreate, BatchOperation
+from ..exhibitions.services import SnapshotService
+
+BLOCK_FIELDS = ("type", "text_content", "book_id")
 
 class SectionService:
     def __init__(self, db: AsyncSession):
@@ -14,10 +22,22 @@ class SectionService:
         
         result = await self.db.execute(
             select(Section)
+            .options(*SECTION_TREE)
             .where(Section.exhibition_id == exhibition_id)
         )
         return result.scalars().all()
 
+    async def get_section(self, section_id: int) -> Section:
+        result = await self.db.execute(
+            select(Section)
+            .options(*SECTION_TREE)
+            .where(Section.id == section_id)
+        )
+        section = result.scalar_one_or_none()
+        if not section:
+            raise HTTPException(404, "Раздел не найден")
+        return section
+
     async def create_section(
         self, 
         exhibition_id: int, 
@@ -32,6 +52,7 @@ class SectionService:
         
         self.db.add(new_section)
         await self.db.flush()
+        await SnapshotService(self.db).refresh(exhibition_id)
         return new_section
 
     async def update_section(
@@ -44,6 +65,7 @@ class SectionService:
         # Optionally, add other updatable fields here
         self.db.add(section)
         await self.db.flush()
+        await SnapshotService(self.db).refresh(exhibition_id)
         return section
     
     
@@ -54,6 +76,157 @@ class SectionService:
     ) -> None:
         section = await self._get_validated_section(exhibition_id, section_id)
         await self.db.delete(section)
+        await SnapshotService(self.db).refresh(exhibition_id)
+
+    async def apply_batch(self, exhibition_id: int, operations: List[BatchOperation]) -> Dict[str, int]:
+        """
+        Операции над разделами и блоками выставки в порядке списка; COMMIT -
+        за вызывающим. Разделы, блоки и книги проверяются тремя запросами
+        IN (...), затем записи группируются: новые блоки - один executemany,
+        правки - executemany на набор полей, удаления - DELETE ... IN.
+        Снимок выставки пересобирается один раз. Возвращает ref -> id новых разделов.
+        """
+        plan = await self._plan_batch(exhibition_id, operations)
+
+        new_sections = [Section(title=op.title, exhibition_id=exhibition_id) for op in plan["create_sections"]]
+        if new_sections:
+            self.db.add_all(new_sections)
+            await self.db.flush()
+        created = {
+            op.ref: section.id
+            for op, section in zip(plan["create_sections"], new_sections)
+            if op.ref is not None
+        }
+
+        if plan["section_titles"]:
+            await self.db.execute(
+                update(Section.__table__)
+                .where(Section.__table__.c.id == bindparam("section_id"))
+                .values(title=bindparam("new_title")),
+                [{"section_id": section_id, "new_title": title} for section_id, title in plan["section_titles"].items()],
+            )
+
+        if plan["create_blocks"]:
+            await self.db.execute(insert(ContentBlock.__table__), [
+                {
+                    "section_id": op.section_id if op.section_id is not None else created[op.section_ref],
+                    "type": ContentBlockType(op.type),
+                    "text_content": op.text_content,
+                    "book_id": op.book_id,
+                }
+                for op in plan["create_blocks"]
+            ])
+
+        # executemany требует одинаковый набор колонок: группы по полям
+        by_fields = defaultdict(list)
+        for block_id, values in plan["block_updates"].items():
+            by_fields[tuple(sorted(values))].append({"block_id": block_id, **{f"new_{k}": v for k, v in values.items()}})
+        table = ContentBlock.__table__
+        for fields, params in by_fields.items():
+            await self.db.execute(
+                update(table)
+                .where(table.c.id == bindparam("block_id"))
+                .values({field: bindparam(f"new_{field}") for field in fields}),
+                params,
+            )
+
+        if plan["delete_blocks"]:
+            await self.db.execute(delete(table).where(table.c.id.in_(plan["delete_blocks"])))
+        if plan["delete_sections"]:
+            # Блоки разделов удаляет БД (ON DELETE CASCADE)
+            await self.db.execute(
+                delete(Section.__table__).where(Section.__table__.c.id.in_(plan["delete_sections"]))
+            )
+
+        # Core-записи мимо identity map: загруженные объекты устарели
+        self.db.expire_all()
+        await SnapshotService(self.db).refresh(exhibition_id)
+        return created
+
+    async def _plan_batch(self, exhibition_id: int, operations: List[BatchOperation]) -> dict:
+        """Проверка всего пакета до первой записи: ошибка в любой операции - 404/422 без изменений."""
+        section_ids = {op.section_id for op in operations if getattr(op, "section_id", None) is not None}
+        block_ids = {op.block_id for op in operations if hasattr(op, "block_id")}
+        book_ids = {op.book_id for op in operations if getattr(op, "book_id", None) is not None}
+
+        sections = set((await self.db.execute(
+            select(Section.id).where(Section.id.in_(section_ids), Section.exhibition_id == exhibition_id)
+        )).scalars()) if section_ids else set()
+        blocks = {
+            block_id: (section_id, block_type.value)
+            for block_id, section_id, block_type in (await self.db.execute(
+                select(ContentBlock.id, ContentBlock.section_id, ContentBlock.type)
+                .join(Section, Section.id == ContentBlock.section_id)
+                .where(ContentBlock.id.in_(block_ids), Section.exhibition_id == exhibition_id)
+            )).all()
+        } if block_ids else {}
+        books = set((await self.db.execute(
+            select(Book.id).where(Book.id.in_(book_ids))
+        )).scalars()) if book_ids else set()
+
+        plan = {
+            "create_sections": [], "section_titles": {}, "delete_sections": [],
+            "create_blocks": [], "block_updates": {}, "delete_blocks": [],
+        }
+        refs = set()
+        deleted_sections, deleted_blocks = set(), set()
+
+        def fail(index: int, status: int, message: str):
+            raise HTTPException(status, f"Операция {index}: {message}")
+
+        for index, op in enumerate(operations):
+            if getattr(op, "section_id", None) is not None and (
+                op.section_id not in sections or op.section_id in deleted_sections
+            ):
+                fail(index, 404, "Раздел не найден")
+            if hasattr(op, "block_id") and (
+                op.block_id not in blocks or op.block_id in deleted_blocks
+                or blocks[op.block_id][0] in deleted_sections
+            ):
+                fail(index, 404, "Блок не найден")
+            if getattr(op, "book_id", None) is not None and op.book_id not in books:
+                fail(index, 404, "Книга не найдена")
+
+            if op.op == "create_section":
+                if op.ref is not None:
+                    if op.ref in refs:
+                        fail(index, 422, f"ref {op.ref} повторяется")
+                    refs.add(op.ref)
+                plan["create_sections"].append(op)
+            elif op.op == "update_section":
+                plan["section_titles"][op.section_id] = op.title
+            elif op.op == "delete_section":
+                deleted_sections.add(op.section_id)
+                plan["section_titles"].pop(op.section_id, None)
+                plan["delete_sections"].append(op.section_id)
+            elif op.op == "create_block":
+                if op.section_ref is not None and op.section_ref not in refs:
+                    fail(index, 422, f"Раздел {op.section_ref} не создан раньше в пакете")
+                plan["create_blocks"].append(op)
+            elif op.op == "update_block":
+                values = op.model_dump(include=set(BLOCK_FIELDS), exclude_unset=True)
+                section_id, block_type = blocks[op.block_id]
+                # Как в ContentService.update_content_block: смена типа очищает другое поле
+                if values.get("type") == "text":
+                    values["book_id"] = None
+                elif values.get("type") == "book":
+                    values["text_content"] = None
+                elif ("book_id" in values and block_type != "book") or ("text_content" in values and block_type != "text"):
+                    fail(index, 422, f"Поле не подходит блоку типа {block_type}")
+                if "type" in values:
+                    values["type"] = ContentBlockType(values["type"])
+                    blocks[op.block_id] = (section_id, values["type"].value)
+                plan["block_updates"].setdefault(op.block_id, {}).update(values)
+            elif op.op == "delete_block":
+                deleted_blocks.add(op.block_id)
+                plan["block_updates"].pop(op.block_id, None)
+                plan["delete_blocks"].append(op.block_id)
+
+        # Блоки удаляемых разделов уходят вместе с ними
+        for block_id, (section_id, _) in blocks.items():
+            if section_id in deleted_sections:
+                plan["block_updates"].pop(block_id, None)
+        return plan
 
     # Helper methods
     async def _validate_exhibition(self, exhibition_id: int) -> None:
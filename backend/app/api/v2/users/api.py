@@ -1,18 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from passlib.context import CryptContext
 from sqlalchemy.future import select
 from sqlalchemy import delete
 
 from ....core import get_db
+from ....core.passwords import password_hasher
 
 from ....models import User, UserRole
 from .schemas import UserLogin, UserCreate, UserSelfUpdate, AdminUserUpdate
 
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 @router.put("/user/update")
@@ -67,8 +66,8 @@ async def login(
             content={"error": "Пользователь не найден"}, status_code=404
         )
 
-    # Проверка пароля
-    if not pwd_context.verify(form_data.password, user.hashed_password):
+    # Проверка пароля: bcrypt в пуле потоков, при перегрузке - 429
+    if not await password_hasher.verify(form_data.password, user.hashed_password):
         return JSONResponse(content={"error": "Неправильный пароль"}, status_code=401)
 
     # Сохраняем информацию о пользователе в сессии
@@ -130,9 +129,6 @@ async def logout(request: Request):
     return response
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
 @router.post("/register")
 async def register(
     request: Request,
@@ -165,7 +161,7 @@ async def register(
         )
 
     # Создание нового пользователя
-    hashed_password = pwd_context.hash(form_data.password)
+    hashed_password = await password_hasher.hash(form_data.password)
 
     try:
         new_user = User(
@@ -212,7 +208,9 @@ from sqlalchemy.future import select
 from sqlalchemy import delete
 from pydantic import BaseModel
 from ....models import User
-from ....core import get_db
+from ....core import get_db, get_read_db
+from ....core.response_cache import response_cache
+from ....core.compression import compressed_cache
 
 
 admin_router = APIRouter()
@@ -226,7 +224,7 @@ def check_admin(request: Request):
 
 # Endpoint для отдачи статической панели админа (файл adminpanel.html должен лежать в каталоге frontend)
 @admin_router.get("/users", response_class=JSONResponse)
-async def get_users(request: Request, db: AsyncSession = Depends(get_db)):
+async def get_users(request: Request, db: AsyncSession = Depends(get_read_db)):
     check_admin(request)
 
     result = await db.execute(select(User))
@@ -245,6 +243,20 @@ async def get_users(request: Request, db: AsyncSession = Depends(get_db)):
     return JSONResponse(content=users_list)
 
 
+@admin_router.get("/cache/stats", response_class=JSONResponse)
+async def get_cache_stats(request: Request):
+    """Попадания, промахи и вытеснения кэша ответов этого воркера."""
+    check_admin(request)
+    return JSONResponse(content={**response_cache.report(), "compressed": compressed_cache.report()})
+
+
+@admin_router.get("/passwords/stats", response_class=JSONResponse)
+async def get_password_stats(request: Request):
+    """Очередь bcrypt этого воркера: операции, отказы 429, задержки."""
+    check_admin(request)
+    return JSONResponse(content=password_hasher.report())
+
+
 @admin_router.put("/users/{user_id}")
 async def update_user_admin(
     user_id: int,
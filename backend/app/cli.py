@@ -0,0 +1,92 @@
+"""
+Служебные команды бэкенда.
+
+    python -m app.cli migrate
+    python -m app.cli rebuild-snapshots
+    python -m app.cli gc-media
+    python -m app.cli export-catalog --format csv --output catalog.csv
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+
+from .core.database import db_helper
+from .core import media
+from .api.v2.exhibitions.services import SnapshotService
+from .api.v2.books.exporter import EXPORT_FORMATS, export_catalog, export_format
+from .api.v2.books.services import ID_CHUNK
+from .models import Base
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+async def migrate(args) -> None:
+    """
+    Схема до запуска приложения: create_all создаёт недостающие таблицы,
+    затем alembic добавляет колонки и индексы в уже существующие (create_all
+    их не меняет). Ревизии пропускают то, что уже есть.
+    """
+    async with db_helper.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await db_helper.close()
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BACKEND_DIR / "migrations"))
+    # env.py запускает свой цикл событий, поэтому alembic - в отдельном потоке
+    await asyncio.to_thread(command.upgrade, config, "head")
+    print("Схема базы обновлена до последней ревизии")
+
+
+async def rebuild_snapshots(args) -> None:
+    async with db_helper.session_factory() as db:
+        count = await SnapshotService(db).rebuild_all()
+        await db.commit()
+    await db_helper.close()
+    print(f"Пересобрано снимков выставок: {count}")
+
+
+async def gc_media(args) -> None:
+    async with db_helper.session_factory() as db:
+        removed = await media.collect_garbage(db)
+    await db_helper.close()
+    print(f"Удалено файлов без ссылок: {removed}")
+
+
+async def export_catalog_file(args) -> None:
+    """Каталог в файл (или stdout) пачками: память не растёт с каталогом."""
+    fmt = export_format(args.format)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async with db_helper.session_factory() as db:
+            async for part in export_catalog(db, fmt, args.chunk_size):
+                output.write(part)
+    finally:
+        if args.output:
+            output.close()
+        await db_helper.close()
+
+
+COMMANDS = {
+    "migrate": migrate,
+    "rebuild-snapshots": rebuild_snapshots,
+    "gc-media": gc_media,
+    "export-catalog": export_catalog_file,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    # export-catalog
+    parser.add_argument("--format", choices=[*EXPORT_FORMATS, "jsonl"], default="csv")
+    parser.add_argument("--output", help="Файл выгрузки; по умолчанию stdout")
+    parser.add_argument("--chunk-size", type=int, default=ID_CHUNK)
+    args = parser.parse_args()
+    asyncio.run(COMMANDS[args.command](args))
+
+
+if __name__ == "__main__":
+    main()
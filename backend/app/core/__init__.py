@@ -1,6 +1,6 @@
-__all__ = ("Base", "get_db", "BASE_DIR", "MEDIA_DIR", "settings")
+__all__ = ("Base", "get_db", "get_read_db", "BASE_DIR", "MEDIA_DIR", "settings")
 
-from .database import get_db, settings
+from .database import get_db, get_read_db, settings
 from .img import BASE_DIR, MEDIA_DIR
 
 ALLOWED_MIME_TYPES = {"image/jpeg", "image/png", "image/gif"}
@@ -0,0 +1,148 @@
+"""
+Сжатие ответов gzip / brotli.
+
+Кодировка выбирается по Accept-Encoding (brotli, если есть модуль Brotli
+и клиент его принимает, иначе gzip). Сжимаются только текстовые ответы
+(JSON, NDJSON, text/*) не меньше settings.compression_min_size, одним
+куском тела; картинки (/picture/) и потоковые ответы идут как есть.
+
+Сжатые тела кэшируются по пути, ETag ответа и кодировке (без ETag - по
+хэшу тела), поэтому горячий ответ сжимается один раз. Большие тела
+сжимаются в пуле потоков: zlib и brotli отпускают GIL, event loop не
+блокируется.
+"""
+import asyncio
+import gzip
+import hashlib
+import re
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import settings
+from .response_cache import ResponseCache
+
+try:
+    import brotli
+except ImportError:  # без Brotli остаётся gzip
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 8
+# Тела меньше этого сжимаются прямо в event loop: переход в поток дороже
+INLINE_LIMIT = 16 * 1024
+SKIP_PATHS = ("/picture/",)
+COMPRESSIBLE = re.compile(r"^(text/|application/(json|x-ndjson|javascript|xml)|image/svg\+xml)")
+
+compressed_cache = ResponseCache(
+    max_bytes=settings.compression_cache_max_bytes,
+    max_entry_bytes=settings.response_cache_max_entry_bytes,
+    ttl=settings.compression_cache_ttl,
+)
+
+
+def supported_encodings() -> List[str]:
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Лучшая из supported_encodings(), которую клиент принимает с q > 0."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for coding in supported_encodings():
+        if accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(SKIP_PATHS):
+            return await self.app(scope, receive, send)
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            headers = MutableHeaders(scope=start)
+            if not self._compressible(start, headers):
+                passthrough = True
+                await send(start)
+                return await send(message)
+            headers.add_vary_header("Accept-Encoding")
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or encoding is None or len(body) < self.min_size:
+                # Потоковый ответ, клиент без сжатия или маленькое тело
+                passthrough = True
+                await send(start)
+                return await send(message)
+
+            compressed = await self._compressed(scope, headers, body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # Сжатое тело - другое представление; слабый ETag по-прежнему
+                # совпадает в If-None-Match (conditional.is_not_modified)
+                headers["ETag"] = f"W/{etag}"
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    def _compressible(start, headers: MutableHeaders) -> bool:
+        return (
+            start["status"] == 200
+            and "content-encoding" not in headers
+            and bool(COMPRESSIBLE.match(headers.get("content-type", "")))
+        )
+
+    @staticmethod
+    async def _compressed(scope, headers: MutableHeaders, body: bytes, encoding: str) -> bytes:
+        validator = headers.get("etag") or hashlib.blake2b(body, digest_size=16).hexdigest()
+        query = scope.get("query_string", b"").decode("latin-1")
+        key = f"{encoding}:{scope['path']}?{query}:{validator}"
+        cached = compressed_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if len(body) < INLINE_LIMIT:
+            compressed = compress(body, encoding)
+        else:
+            compressed = await asyncio.get_running_loop().run_in_executor(
+                None, compress, body, encoding
+            )
+        compressed_cache.set(key, compressed)
+        return compressed
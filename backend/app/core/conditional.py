@@ -0,0 +1,82 @@
+"""
+Условные GET: строгий ETag и Last-Modified из версий строк.
+
+Валидатор строится одним агрегирующим запросом по колонкам version /
+updated_at (VersionedMixin), без загрузки графа объектов. Если клиент
+прислал совпадающий If-None-Match, отвечаем 304 и дальше не идём.
+Изменения дочерних строк (разделы, блоки, состав книги) поднимают
+версию родителя через touch().
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+@dataclass
+class Validator:
+    etag: str
+    last_modified: Optional[datetime]
+
+    @property
+    def headers(self) -> dict:
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def apply(self, response: Response) -> Response:
+        response.headers.update(self.headers)
+        return response
+
+
+def make_validator(resource: str, parts: Iterable[Any], *timestamps) -> Validator:
+    """ETag - хэш имени ресурса и версий; Last-Modified - самое позднее время."""
+    digest = hashlib.blake2b(
+        repr((resource, *parts)).encode(), digest_size=16
+    ).hexdigest()
+    moments = [_as_utc(moment) for moment in timestamps if moment is not None]
+    return Validator(f'"{digest}"', max(moments) if moments else None)
+
+
+def is_not_modified(request: Request, validator: Validator) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since учитывается, только если If-None-Match нет
+        # Для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or validator.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and validator.last_modified is not None:
+        try:
+            since = _as_utc(parsedate_to_datetime(if_modified_since))
+        except (TypeError, ValueError):
+            return False
+        return validator.last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def not_modified(validator: Validator) -> Response:
+    return Response(status_code=304, headers=validator.headers)
+
+
+async def touch(db: AsyncSession, model, ids) -> None:
+    """Поднять версию строк: ids - список id или подзапрос."""
+    await db.execute(
+        update(model)
+        .where(model.id.in_(ids))
+        .values(version=model.version + 1, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _as_utc(moment: datetime) -> datetime:
+    # DATETIME в MySQL без зоны; сервер пишет now() в UTC
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
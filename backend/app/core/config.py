@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 import os
 from pathlib import Path
 
@@ -17,6 +18,36 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     db_url: str 
     db_echo: bool = True
+    # Реплика MySQL для GET-запросов; пусто - всё читается из db_url
+    db_replica_url: Optional[str] = None
+    # Сколько секунд после записи клиент читает из primary
+    read_your_writes_seconds: float = 5
+    # Кэш ответов горячих GET-эндпоинтов (в памяти каждого воркера)
+    response_cache_ttl: float = 30
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_max_entry_bytes: int = 4 * 1024 * 1024
+    # Процессы для уменьшенных копий изображений и предел задач в очереди
+    image_workers: int = 2
+    image_queue_size: int = 16
+    # Строк на пачку при массовом импорте каталога
+    import_chunk_size: int = 500
+    # Процессы фонового импорта и каталог их файлов (пусто - во временном каталоге)
+    import_workers: int = 1
+    import_dir: Optional[str] = None
+    # Предел тела multipart для импорта каталога и пакета обложек; остальные
+    # загрузки ограничены MAX_FILE_SIZE плюс поля формы
+    import_max_body: int = 2 * 1024 * 1024 * 1024
+    covers_max_body: int = 512 * 1024 * 1024
+    # Потоки bcrypt и сколько операций может ждать; сверх этого - 429
+    password_hash_workers: int = 2
+    password_hash_queue_size: int = 32
+    # Сжатие ответов: минимальный размер тела и кэш сжатых тел
+    compression_min_size: int = 1024
+    compression_cache_max_bytes: int = 32 * 1024 * 1024
+    compression_cache_ttl: float = 3600
+    # internal-location nginx для X-Accel-Redirect (например /protected-media/);
+    # пусто - /picture/ отдаёт байты сам Python
+    media_accel_redirect: Optional[str] = None
 
     class Config:
         env_file = Path(__file__).resolve().parent.parent.parent / ".env"
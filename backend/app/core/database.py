@@ -1,13 +1,29 @@
+import time
+from typing import Optional
+
+from fastapi import Request
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from starlette.datastructures import MutableHeaders
 from .config import settings
+from .sql_stats import instrument_engine
+
+# Cookie "читать свои записи": до указанного времени чтения идут в primary
+PRIMARY_COOKIE = "db_primary_until"
+# Явный запрос чтения из primary (например, сразу после собственной записи)
+PRIMARY_HEADER = "x-read-primary"
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
 
 class DatabaseHelper:
-    def __init__(self, url: str, echo: bool = False):
+    def __init__(self, url: str, echo: bool = False, replica_url: Optional[str] = None):
         self.engine = create_async_engine(
             url=url,
             echo=echo,
             future=True, 
         )
+        # Счётчики запросов для Server-Timing и тестовых бюджетов
+        instrument_engine(self.engine)
         self.session_factory = async_sessionmaker(
             bind=self.engine,
             autocommit=False,
@@ -15,15 +31,39 @@ class DatabaseHelper:
             class_=AsyncSession,
         )
 
+        # Реплика для чтения; без неё чтения идут в основной движок
+        self.replica_engine = None
+        self.read_session_factory = self.session_factory
+        if replica_url:
+            self.replica_engine = create_async_engine(
+                url=replica_url,
+                echo=echo,
+                future=True,
+            )
+            instrument_engine(self.replica_engine)
+            self.read_session_factory = async_sessionmaker(
+                bind=self.replica_engine,
+                autocommit=False,
+                expire_on_commit=False,
+                class_=AsyncSession,
+            )
+
+    @property
+    def has_replica(self) -> bool:
+        return self.replica_engine is not None
+
     async def close(self):
         """Закрыть соединение с базой данных."""
         await self.engine.dispose()
+        if self.replica_engine is not None:
+            await self.replica_engine.dispose()
 
 
 # Экземпляр DatabaseHelper (создается один раз)
 db_helper = DatabaseHelper(
     url=settings.db_url,
     echo=settings.db_echo,
+    replica_url=settings.db_replica_url,
 )
 
 
@@ -34,3 +74,55 @@ async def get_db() -> AsyncSession:
             yield session
         finally:
             await session.close()  
+
+
+def reads_from_primary(request: Request) -> bool:
+    """Клиент недавно писал или явно попросил primary."""
+    if request.headers.get(PRIMARY_HEADER):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_db(request: Request) -> AsyncSession:
+    """Сессия только для чтения: реплика, если она настроена."""
+    factory = db_helper.read_session_factory
+    if reads_from_primary(request):
+        factory = db_helper.session_factory
+    async with factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+class ReadYourWritesMiddleware:
+    """
+    После успешного изменяющего запроса ставит cookie, по которой
+    get_read_db ещё read_your_writes_seconds читает из primary, пока
+    реплика догоняет.
+    """
+
+    def __init__(self, app, window: float):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + self.window
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{PRIMARY_COOKIE}={until:.0f}; Max-Age={int(self.window)}; Path=/; "
+                    "HttpOnly; Secure; SameSite=None",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,325 @@
+"""
+Копии загруженных изображений (обложки, картинки выставок).
+
+Оригинал может весить до MAX_FILE_SIZE и содержать EXIF, поэтому рядом
+с ним хранятся перекодированные копии без метаданных:
+MEDIA_DIR/derivatives/<ширина или full>/<имя>, где ширина - одна из
+DERIVATIVE_WIDTHS. Для каждой ширины есть копия в формате оригинала
+и копии WebP/AVIF (если их поддерживает сборка Pillow).
+
+Копии строятся в отдельных процессах (Pillow держит GIL), пул и
+очередь задач ограничены. После загрузки всё строится в фоне; при
+запросе /picture/{name}?w= недостающая копия в формате оригинала
+строится сразу, современные форматы - в фоне. Анимация и нечитаемые
+файлы помечаются в derivatives/failed и дальше отдаются оригиналом.
+"""
+import asyncio
+import logging
+import os
+import stat
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from PIL import Image, ImageOps
+
+from .config import settings
+from .img import MEDIA_DIR
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (160, 480, 1200)
+# None - полный размер
+SIZES = DERIVATIVE_WIDTHS + (None,)
+DERIVATIVES_DIR = MEDIA_DIR / "derivatives"
+
+MODERN_MIME_TYPES = {"AVIF": "image/avif", "WEBP": "image/webp"}
+Image.init()
+MODERN_FORMATS = tuple(fmt for fmt in MODERN_MIME_TYPES if fmt in Image.SAVE)
+
+_SAVE_OPTIONS = {
+    "JPEG": {"quality": 82, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 80, "method": 4},
+    "AVIF": {"quality": 60, "speed": 6},
+}
+# Метаданные, без которых картинка отрисуется иначе; остальное (EXIF, XMP) удаляется
+_KEEP_INFO = ("icc_profile", "transparency")
+
+
+def bucket_width(width: int) -> Optional[int]:
+    """Наименьшая ширина из DERIVATIVE_WIDTHS, не меньше запрошенной; None - полный размер."""
+    for bucket in DERIVATIVE_WIDTHS:
+        if width <= bucket:
+            return bucket
+    return None
+
+
+def variant_path(filename: str, width: Optional[int] = None, image_format: Optional[str] = None) -> Path:
+    """Копия ширины width (None - полный размер) в формате image_format (None - как у оригинала)."""
+    folder = DERIVATIVES_DIR / (str(width) if width else "full")
+    if image_format is None:
+        return folder / filename
+    return folder / f"{Path(filename).stem}.{image_format.lower()}"
+
+
+def accepted_formats(accept: str) -> Set[str]:
+    """Современные форматы, явно перечисленные в Accept с q > 0."""
+    formats = set()
+    for item in accept.split(","):
+        media_type, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality <= 0:
+            continue
+        for image_format, mime_type in MODERN_MIME_TYPES.items():
+            if media_type.strip().lower() == mime_type:
+                formats.add(image_format)
+    return formats
+
+
+def failed_marker(filename: str) -> Path:
+    """Метка оригинала, из которого копии не строятся: он отдаётся как есть."""
+    return DERIVATIVES_DIR / "failed" / filename
+
+
+def _mark_failed(filename: str) -> None:
+    marker = failed_marker(filename)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.touch()
+
+
+def build_derivatives(
+    source: str,
+    filename: str,
+    widths: Tuple[Optional[int], ...],
+    formats: Tuple[Optional[str], ...],
+) -> None:
+    """Выполняется в процессе пула: одно чтение оригинала на все копии."""
+    try:
+        original = Image.open(source)
+        original.load()
+    except FileNotFoundError:
+        raise
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Битый или неподдерживаемый оригинал: запоминаем, чтобы не открывать его на каждый запрос
+        logger.warning("Оригинал %s не читается (%s), копии не строятся", filename, e)
+        _mark_failed(filename)
+        return
+    with original:
+        # Анимацию перекодирование испортит; такие файлы отдаются оригиналом
+        if getattr(original, "is_animated", False):
+            _mark_failed(filename)
+            return
+        source_format = original.format
+        image = ImageOps.exif_transpose(original)
+        image.info = {key: image.info[key] for key in _KEEP_INFO if key in image.info}
+
+        # От большей ширины к меньшей, чтобы каждый раз уменьшать уже уменьшенное
+        for width in sorted(widths, key=lambda w: w or float("inf"), reverse=True):
+            if width and image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            for image_format in formats:
+                target = variant_path(filename, width, image_format)
+                # Готовая копия отдаётся как immutable: не перезаписывается
+                if not target.exists():
+                    _save(image, target, image_format or source_format)
+
+
+def _save(image: Image.Image, target: Path, image_format: str) -> None:
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    elif image_format in MODERN_MIME_TYPES and image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Своё временное имя на каждую запись: параллельные сборки одной копии
+    # в разных процессах не пишут в один файл
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            image.save(file, image_format, **_SAVE_OPTIONS.get(image_format, {}))
+        os.replace(tmp, target)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _sizes(paths: Sequence[Path]) -> List[Optional[int]]:
+    """Размеры обычных файлов (None - файла нет). Вызывается в потоке: stat блокирует."""
+    sizes = []
+    for path in paths:
+        try:
+            result = path.stat()
+        except OSError:
+            sizes.append(None)
+            continue
+        sizes.append(result.st_size if stat.S_ISREG(result.st_mode) else None)
+    return sizes
+
+
+def _missing(
+    filename: str,
+    widths: Tuple[Optional[int], ...],
+    formats: Tuple[Optional[str], ...],
+) -> Optional[Tuple[Tuple[Optional[int], ...], Tuple[Optional[str], ...]]]:
+    """Ширины и форматы, для которых нет копий; None - оригинал помечен как непригодный."""
+    if failed_marker(filename).exists():
+        return None
+    widths = tuple(w for w in widths if any(not variant_path(filename, w, f).is_file() for f in formats))
+    formats = tuple(f for f in formats if any(not variant_path(filename, w, f).is_file() for w in widths))
+    return widths, formats
+
+
+class DerivativePool:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Не больше queue_size задач в пуле одновременно, остальные ждут
+        self._slots = asyncio.Semaphore(queue_size)
+        self._queue_size = queue_size
+        # Путь копии -> задача, которая её сейчас строит
+        self._pending: Dict[Path, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def build(
+        self,
+        filename: str,
+        widths: Tuple[Optional[int], ...] = SIZES,
+        formats: Tuple[Optional[str], ...] = (None, *MODERN_FORMATS),
+    ) -> None:
+        targets = [variant_path(filename, width, image_format) for width in widths for image_format in formats]
+        # Копию, которую уже строит другая задача (фоновая или по ?w=), ждём, а не строим второй раз
+        while running := {self._pending[target] for target in targets if target in self._pending}:
+            await asyncio.gather(*(asyncio.shield(task) for task in running), return_exceptions=True)
+        missing = await asyncio.to_thread(_missing, filename, widths, formats)
+        if missing is None:
+            return
+        widths, formats = missing
+        if not widths or not formats:
+            return
+        targets = [variant_path(filename, width, image_format) for width in widths for image_format in formats]
+        future = asyncio.get_running_loop().create_future()
+        for target in targets:
+            self._pending[target] = future
+        try:
+            async with self._slots:
+                await asyncio.get_running_loop().run_in_executor(
+                    self.executor,
+                    build_derivatives,
+                    str(MEDIA_DIR / filename),
+                    filename,
+                    widths,
+                    formats,
+                )
+            future.set_result(None)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # исключение уже отдано вызывающему
+            raise
+        finally:
+            for target in targets:
+                if self._pending.get(target) is future:
+                    del self._pending[target]
+
+    def schedule(self, filename: str, *args) -> None:
+        """Фоновая сборка копий (аргументы как у build); при полной очереди - пропуск."""
+        if len(self._background) >= self._queue_size:
+            logger.warning("Очередь копий изображений заполнена, %s отложен", filename)
+            return
+        task = asyncio.create_task(self._build_logged(filename, *args))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def pick(self, filename: str, width: Optional[int], accept: str) -> Tuple[Path, Optional[str]]:
+        """
+        Самый лёгкий из файлов, подходящих клиенту: копия нужной ширины в
+        формате оригинала или в WebP/AVIF из Accept. Возвращает путь и
+        media type (None - определить по расширению).
+        """
+        original = MEDIA_DIR / filename
+        wanted = [fmt for fmt in MODERN_FORMATS if fmt in accepted_formats(accept)]
+        # Все проверки файлов - одним вызовом в потоке, не на event loop:
+        # метка отказа, оригинал, копия в формате оригинала, WebP/AVIF
+        paths = [
+            failed_marker(filename),
+            original,
+            variant_path(filename, width),
+            *(variant_path(filename, width, fmt) for fmt in wanted),
+        ]
+        sizes = await asyncio.to_thread(_sizes, paths)
+        if sizes[0] is not None:
+            return original, None
+        if width is not None and sizes[2] is None:
+            try:
+                await self.build(filename, (width,), (None,))
+            except Exception:
+                logger.exception("Не удалось построить копию %s шириной %s", filename, width)
+            sizes = await asyncio.to_thread(_sizes, paths)
+            if sizes[0] is not None:
+                # Анимация или битый файл: отдаём как есть
+                return original, None
+
+        candidates = []
+        missing = []
+        if sizes[2] is not None:
+            candidates.append((sizes[2], paths[2], None))
+        else:
+            # Оригинал (с EXIF) - только пока нет очищенной копии
+            if sizes[1] is not None:
+                candidates.append((sizes[1], original, None))
+            if width is None:
+                missing.append(None)
+        for image_format, path, size in zip(wanted, paths[3:], sizes[3:]):
+            if size is None:
+                missing.append(image_format)
+            else:
+                candidates.append((size, path, MODERN_MIME_TYPES[image_format]))
+        if missing:
+            self.schedule(filename, (width,), tuple(missing))
+
+        if not candidates:
+            return original, None
+        _, path, media_type = min(candidates, key=lambda item: item[0])
+        return path, media_type
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _build_logged(self, filename: str, *args) -> None:
+        try:
+            await self.build(filename, *args)
+        except Exception:
+            logger.exception("Не удалось построить копии изображения %s", filename)
+
+
+def remove_derivatives(filename: str) -> None:
+    for width in SIZES:
+        for image_format in (None, *MODERN_MIME_TYPES):
+            path = variant_path(filename, width, image_format)
+            if path.exists():
+                path.unlink()
+    failed_marker(filename).unlink(missing_ok=True)
+
+
+derivative_pool = DerivativePool(
+    workers=settings.image_workers,
+    queue_size=settings.image_queue_size,
+)
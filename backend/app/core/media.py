@@ -0,0 +1,333 @@
+"""
+Хранилище загруженных изображений с адресацией по содержимому.
+
+Загрузка копируется во временный файл кусками по CHUNK_SIZE: память на
+запрос не зависит от размера файла, лимит MAX_FILE_SIZE проверяется по
+мере поступления байтов, тип определяется по сигнатуре файла, а не по
+Content-Type клиента. Готовый файл атомарно переименовывается в MEDIA_DIR.
+
+Файл называется SHA-256 своего содержимого (хэш считается по ходу
+записи), поэтому одинаковая обложка у разных книг и выставок хранится
+один раз, а URL /picture/<digest>.<ext> никогда не меняет содержимое.
+Поэтому serve() отдаёт такие файлы с Cache-Control: immutable, а если
+задан settings.media_accel_redirect - только заголовок X-Accel-Redirect,
+и байты (с Range и If-Modified-Since) отдаёт nginx через sendfile.
+
+Ссылки на файл - это Book.image_url и Exhibition.image. Файл удаляется,
+только когда после записи на него не осталось ни одной ссылки, и только
+после COMMIT (при откате ничего не удаляется). Само удаление (файл и его
+копии) идёт в фоне в пуле потоков: ответ на DELETE его не ждёт.
+"""
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import stat
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Set
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, Request, Response, UploadFile
+from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import ALLOWED_MIME_TYPES, MAX_FILE_SIZE
+from .conditional import Validator, is_not_modified
+from .config import settings
+from .img import MEDIA_DIR
+from .images import bucket_width, derivative_pool, remove_derivatives
+from ..models import Book, Exhibition
+
+CHUNK_SIZE = 1024 * 1024
+MEDIA_URL_PREFIX = "/picture/"
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif"}
+MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+# Имена, которые может отдать /picture/: без каталогов и скрытых (.upload-*.tmp) файлов
+SERVABLE_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Файл, заново загруженный за это время, не удаляется: его могла
+# подхватить параллельная транзакция, которую подсчёт ссылок ещё не видит
+REUPLOAD_GRACE_SECONDS = 60
+
+
+def is_content_addressed(filename: str) -> bool:
+    return bool(CONTENT_ADDRESSED.match(filename))
+
+
+def media_url(filename: str) -> str:
+    return f"{MEDIA_URL_PREFIX}{filename}"
+
+
+def filename_from_url(url: str) -> str:
+    return url.split("/")[-1]
+
+
+def sniff_mime_type(head: bytes) -> Optional[str]:
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    return None
+
+
+async def store_upload(
+    image: UploadFile,
+    max_size: int = MAX_FILE_SIZE,
+    allowed_types=ALLOWED_MIME_TYPES,
+) -> str:
+    """Сохраняет загрузку под её SHA-256 и возвращает имя файла."""
+    await aiofiles.os.makedirs(MEDIA_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp = MEDIA_DIR / f".upload-{uuid.uuid4()}.tmp"
+    mime_type = None
+    size = 0
+    try:
+        await image.seek(0)
+        async with aiofiles.open(tmp, "wb") as f:
+            while chunk := await image.read(CHUNK_SIZE):
+                if mime_type is None:
+                    mime_type = sniff_mime_type(chunk)
+                    if mime_type not in allowed_types:
+                        raise HTTPException(415, "Invalid image format")
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(413, "File too large")
+                digest.update(chunk)
+                await f.write(chunk)
+        if mime_type is None:
+            raise HTTPException(415, "Invalid image format")
+        filename = f"{digest.hexdigest()}{EXTENSIONS[mime_type]}"
+        target = MEDIA_DIR / filename
+        if await aiofiles.os.path.exists(target):
+            # Такой файл уже есть: копия не нужна, отмечаем повторную загрузку
+            await asyncio.to_thread(os.utime, target)
+        else:
+            await aiofiles.os.replace(tmp, target)
+            derivative_pool.schedule(filename)
+        return filename
+    finally:
+        try:
+            await aiofiles.os.remove(tmp)
+        except FileNotFoundError:
+            pass
+
+
+async def serve(request: Request, filename: str, width: Optional[int] = None) -> Response:
+    """Ответ /picture/{filename}: копия под ширину и Accept, Range, 304."""
+    if not SERVABLE_NAME.match(filename):
+        return _file_not_found()
+    try:
+        original = await aiofiles.os.stat(MEDIA_DIR / filename)
+    except FileNotFoundError:
+        return _file_not_found()
+    if not stat.S_ISREG(original.st_mode):
+        return _file_not_found()
+
+    # Формат выбирается по Accept: самый лёгкий из поддерживаемых клиентом
+    path, media_type = await derivative_pool.pick(
+        filename, bucket_width(width) if width else None, request.headers.get("accept", "")
+    )
+    headers = {"Vary": "Accept"}
+    if is_content_addressed(filename):
+        # Имя - хэш содержимого: по этому URL всегда те же байты
+        headers["Cache-Control"] = IMMUTABLE
+    else:
+        headers["Cache-Control"] = "no-cache"
+
+    if settings.media_accel_redirect:
+        # Python только выбрал файл; Range, If-Modified-Since и sendfile - у nginx
+        location = settings.media_accel_redirect.rstrip("/") + "/" + path.relative_to(MEDIA_DIR).as_posix()
+        headers["X-Accel-Redirect"] = location
+        headers["Content-Type"] = media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        return Response(headers=headers)
+
+    # Range и If-Range обрабатывает сам FileResponse
+    response = FileResponse(path, media_type=media_type, headers=headers, stat_result=await aiofiles.os.stat(path))
+    validator = Validator(
+        response.headers["etag"],
+        datetime.fromtimestamp(response.stat_result.st_mtime, timezone.utc),
+    )
+    if is_not_modified(request, validator):
+        return Response(status_code=304, headers={
+            **headers,
+            "ETag": validator.etag,
+            "Last-Modified": response.headers["last-modified"],
+        })
+    return response
+
+
+def _file_not_found() -> Response:
+    return JSONResponse(status_code=404, content={"detail": "File not found"})
+
+
+async def count_references(db: AsyncSession, url: str) -> int:
+    books = await db.scalar(
+        select(func.count()).select_from(Book).where(Book.image_url == url)
+    )
+    exhibitions = await db.scalar(
+        select(func.count()).select_from(Exhibition).where(Exhibition.image == url)
+    )
+    return books + exhibitions
+
+
+async def release(db: AsyncSession, *urls: str) -> None:
+    """
+    Вызывается после того, как строка перестала ссылаться на url (замена
+    или удаление). Файлы без ссылок удаляются после COMMIT.
+    """
+    await db.flush()
+    for url in set(filter(None, urls)):
+        if await count_references(db, url) == 0:
+            db.info.setdefault("released_media", set()).add(filename_from_url(url))
+
+
+logger = logging.getLogger(__name__)
+
+_cleanup: Set[asyncio.Future] = set()
+
+
+def remove_file(filename: str) -> None:
+    path = MEDIA_DIR / filename
+    try:
+        if time.time() - path.stat().st_mtime < REUPLOAD_GRACE_SECONDS:
+            return
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    remove_derivatives(filename)
+
+
+async def collect_garbage(db: AsyncSession) -> int:
+    """Удаляет файлы без ссылок (например, оставленные из-за REUPLOAD_GRACE_SECONDS)."""
+    referenced = set()
+    for column in (Book.image_url, Exhibition.image):
+        result = await db.execute(select(column).where(column.is_not(None)).distinct())
+        referenced.update(filename_from_url(url) for url in result.scalars())
+    removed = 0
+    for path in MEDIA_DIR.iterdir():
+        if not path.is_file() or path.name.startswith(".") or path.name in referenced:
+            continue
+        if time.time() - path.stat().st_mtime >= REUPLOAD_GRACE_SECONDS:
+            remove_file(path.name)
+            removed += 1
+    return removed
+
+
+def schedule_removal(filenames: Iterable[str]) -> None:
+    """Удаление файлов в фоне; без event loop (CLI) - сразу."""
+    filenames = list(filenames)
+    if not filenames:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _remove_files(filenames)
+        return
+    future = loop.run_in_executor(None, _remove_files, filenames)
+    _cleanup.add(future)
+    future.add_done_callback(_cleanup.discard)
+
+
+def _remove_files(filenames) -> None:
+    for filename in filenames:
+        try:
+            remove_file(filename)
+        except OSError:
+            # Останется до collect_garbage
+            logger.exception("Не удалось удалить %s", filename)
+
+
+async def wait_cleanup() -> None:
+    """Дождаться фоновых удалений (при остановке приложения)."""
+    if _cleanup:
+        await asyncio.gather(*_cleanup, return_exceptions=True)
+
+
+@event.listens_for(Session, "after_commit")
+def _remove_released(session: Session) -> None:
+    schedule_removal(session.info.pop("released_media", ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_released(session: Session) -> None:
+    session.info.pop("released_media", None)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Обрывает multipart-запрос больше max_body байт, пока он ещё приходит:
+    по Content-Length сразу, иначе по счётчику принятых байтов. Без этого
+    Starlette сначала целиком сохраняет тело во временные файлы.
+    path_limits - свои пределы для префиксов пути (импорт, пакеты файлов);
+    действует самый длинный подходящий префикс.
+    """
+    def __init__(self, app, max_body: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_body = max_body
+        self.path_limits = sorted((path_limits or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_multipart(scope):
+            return await self.app(scope, receive, send)
+
+        max_body = self._limit(scope["path"])
+        headers = dict(scope["headers"])
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > max_body:
+            return await self._reject(send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    # FastAPI пробрасывает HTTPException из разбора тела как есть
+                    raise HTTPException(413, "File too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _limit(self, path: str) -> int:
+        for prefix, limit in self.path_limits:
+            if path.startswith(prefix):
+                return limit
+        return self.max_body
+
+    @staticmethod
+    def _is_multipart(scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == b"content-type":
+                return value.startswith(b"multipart/form-data")
+        return False
+
+    @staticmethod
+    async def _reject(send) -> None:
+        body = b'{"detail":"File too large"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,6 +1,11 @@
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from .config import settings
+from .sql_stats import QueryStatsMiddleware
+from .database import db_helper, ReadYourWritesMiddleware
+from .media import UploadSizeLimitMiddleware
+from .compression import CompressionMiddleware
+from . import MAX_FILE_SIZE
 from ..api.v2 import (
     exhibitions_router,
     sections_router,
@@ -19,12 +24,32 @@ origins = [
 ]
 
 def setup_middleware(app):
+    # gzip/brotli для JSON; сжатые тела кэшируются по ETag
+    app.add_middleware(CompressionMiddleware, min_size=settings.compression_min_size)
+    # Число SQL-запросов и время в БД -> заголовок Server-Timing
+    app.add_middleware(QueryStatsMiddleware)
+    # Файл до MAX_FILE_SIZE плюс поля формы; больше - 413, не дожидаясь конца тела.
+    # Импорт каталога и пакет обложек - со своими пределами из настроек
+    app.add_middleware(
+        UploadSizeLimitMiddleware,
+        max_body=MAX_FILE_SIZE + 1024 * 1024,
+        path_limits={
+            "/v2/library/books/import/": settings.import_max_body,
+            "/v2/library/books/covers/": settings.covers_max_body,
+        },
+    )
+    # Окно "читать свои записи" нужно, только когда GET идут в реплику
+    if db_helper.has_replica:
+        app.add_middleware(
+            ReadYourWritesMiddleware, window=settings.read_your_writes_seconds
+        )
     app.add_middleware(
         CORSMiddleware,
         allow_origins=origins,
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Cache"],
     )
     # Затем SessionMiddlew``are
     app.add_middleware(
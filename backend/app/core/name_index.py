@@ -0,0 +1,143 @@
+"""
+Индекс имён в памяти процесса для автодополнения (авторы, жанры).
+
+Каждое имя раскладывается на n-граммы длиной 1..3; поиск пересекает
+списки id по n-граммам запроса и проверяет вхождение подстроки, то есть
+сохраняет семантику ilike '%q%' без обращения к MySQL. Результаты
+ранжируются: совпадение с начала имени, с начала слова, позиция
+вхождения, длина имени.
+
+Устаревший индекс перестраивается в потоке (refresh): построение n-грамм
+на десятках тысяч имён не занимает event loop, а поиск до подмены
+отвечает по старому индексу.
+"""
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+GRAM_SIZE = 3
+
+
+def normalize(name: str) -> str:
+    return name.casefold().replace("ё", "е")
+
+
+def _grams(text: str, size: int) -> Set[str]:
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class NameIndex:
+    def __init__(self, max_age: float = 60.0):
+        # Другие воркеры не видят записи этого процесса, поэтому индекс
+        # перестраивается из БД, если он старше max_age секунд
+        self.max_age = max_age
+        self.built_at = 0.0
+        self._names: Dict[int, Tuple[str, str]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        # Одно перестроение на процесс; правки за время перестроения
+        # повторяются на новом индексе
+        self._refreshing = asyncio.Lock()
+        self._changes: Optional[List[Tuple[int, Optional[str]]]] = None
+        self._invalidated = False
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.built_at > self.max_age
+
+    def rebuild(self, rows: Iterable[Tuple[int, str]]) -> None:
+        self._names.clear()
+        self._postings.clear()
+        for item_id, name in rows:
+            self.add(item_id, name)
+        self.built_at = time.monotonic()
+
+    async def refresh(self, load: Callable[[], Awaitable[Iterable[Tuple[int, str]]]]) -> None:
+        """
+        Перестроение по строкам из load() без блокировки event loop. Если
+        перестроение уже идёт, вызов не ждёт его: поиск идёт по старому индексу.
+        """
+        if self._refreshing.locked():
+            return
+        async with self._refreshing:
+            if not self.is_stale:
+                return
+            started = time.monotonic()
+            self._invalidated = False
+            self._changes = []
+            try:
+                rows = await load()
+                fresh = NameIndex(self.max_age)
+                await asyncio.get_running_loop().run_in_executor(None, fresh.rebuild, rows)
+                changes, self._changes = self._changes, None
+                self._names, self._postings = fresh._names, fresh._postings
+                for item_id, name in changes:
+                    if name is None:
+                        self.remove(item_id)
+                    else:
+                        self.add(item_id, name)
+            finally:
+                self._changes = None
+            # invalidate() во время перестроения: снимок мог его не застать
+            self.built_at = 0.0 if self._invalidated else started
+
+    def invalidate(self) -> None:
+        """Следующий поиск перестроит индекс из БД (после массовых записей)."""
+        self.built_at = 0.0
+        self._invalidated = True
+
+    def add(self, item_id: int, name: str) -> None:
+        if self._changes is not None:
+            self._changes.append((item_id, name))
+        self._discard(item_id)
+        if not name:
+            return
+        norm = normalize(name)
+        self._names[item_id] = (name, norm)
+        for size in range(1, GRAM_SIZE + 1):
+            for gram in _grams(norm, size):
+                self._postings.setdefault(gram, set()).add(item_id)
+
+    def remove(self, item_id: int) -> None:
+        if self._changes is not None:
+            self._changes.append((item_id, None))
+        self._discard(item_id)
+
+    def _discard(self, item_id: int) -> None:
+        entry = self._names.pop(item_id, None)
+        if entry is None:
+            return
+        norm = entry[1]
+        for size in range(1, GRAM_SIZE + 1):
+            for gram in _grams(norm, size):
+                ids = self._postings.get(gram)
+                if ids is not None:
+                    ids.discard(item_id)
+                    if not ids:
+                        del self._postings[gram]
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        q = normalize(query.strip())
+        if not q:
+            return []
+
+        grams = _grams(q, min(len(q), GRAM_SIZE))
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+
+        def rank(item_id: int):
+            name, norm = self._names[item_id]
+            position = norm.find(q)
+            if position == 0:
+                kind = 0
+            elif norm[position - 1] in " -.":
+                kind = 1
+            else:
+                kind = 2
+            return kind, position, len(norm), norm, item_id
+
+        matches = [item_id for item_id in candidates if q in self._names[item_id][1]]
+        return [
+            {"id": item_id, "name": self._names[item_id][0]}
+            for item_id in heapq.nsmallest(limit, matches, key=rank)
+        ]
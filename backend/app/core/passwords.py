@@ -0,0 +1,129 @@
+"""
+Хэширование паролей bcrypt вне event loop.
+
+Один bcrypt занимает 100-300 мс CPU; вызванный прямо в async-обработчике,
+он останавливает все запросы воркера. PasswordHasher выполняет hash и
+verify в своём пуле потоков (bcrypt отпускает GIL). Одновременно в работе
+и в очереди не больше workers + queue_size операций, остальные сразу
+получают 429: всплеск входов не копит бесконечную очередь.
+
+report() - число операций, отказов и задержки (ожидание в очереди и
+само хэширование) для /admin/passwords/stats.
+"""
+import asyncio
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from .config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Сколько последних замеров держать для перцентилей
+LATENCY_SAMPLES = 1000
+
+
+@dataclass
+class OperationStats:
+    count: int = 0
+    rejected: int = 0
+    wait: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+    run: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def report(self) -> dict:
+        return {
+            "count": self.count,
+            "rejected": self.rejected,
+            "wait_ms": _percentiles(self.wait),
+            "run_ms": _percentiles(self.run),
+        }
+
+
+def _percentiles(samples: Deque[float]) -> Optional[dict]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "p50": round(statistics.median(ordered) * 1000, 1),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        "max": round(ordered[-1] * 1000, 1),
+    }
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.in_flight = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats: Dict[str, OperationStats] = {"hash": OperationStats(), "verify": OperationStats()}
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verify", pwd_context.verify, password, hashed)
+
+    def report(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "limit": self.limit,
+            **{name: stats.report() for name, stats in self.stats.items()},
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, operation: str, func, *args):
+        stats = self.stats[operation]
+        if self.in_flight >= self.limit:
+            stats.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Слишком много запросов, повторите позже",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        loop = asyncio.get_running_loop()
+        queued = time.perf_counter()
+        started = finished = None
+
+        def timed():
+            nonlocal started, finished
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+
+        def release(_):
+            self.in_flight -= 1
+
+        # Слот освобождается, когда поток закончил, а не когда клиент отключился
+        job = self.executor.submit(timed)
+        job.add_done_callback(lambda done: loop.call_soon_threadsafe(release, done))
+        result = await asyncio.wrap_future(job)
+        stats.count += 1
+        stats.wait.append(started - queued)
+        stats.run.append(finished - started)
+        return result
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    queue_size=settings.password_hash_queue_size,
+)
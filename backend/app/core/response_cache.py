@@ -0,0 +1,182 @@
+"""
+Кэш ответов в памяти процесса для горячих GET-эндпоинтов.
+
+LRU с TTL и лимитом по байтам. Каждая запись помечена тегами
+(book:{id}, exhibition:{slug}, authors ...). Сервисы при записи
+отмечают теги на сессии через invalidate_on_commit, а после COMMIT
+все записи с этими тегами сбрасываются. Другие воркеры про чужие
+записи не знают и видят изменения не позже чем через TTL.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import reads_from_primary
+from .serialization import JSONBytesResponse, adapter
+
+
+@dataclass
+class _Entry:
+    body: bytes
+    expires: float
+    tags: FrozenSet[str]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, max_entry_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.size = 0
+        # Растёт при каждой инвалидации: ответ, собранный до неё, не кэшируется
+        self.generation = 0
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires <= time.monotonic():
+            self._drop(key)
+            self.stats.expirations += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry.body
+
+    def set(
+        self,
+        key: str,
+        body: bytes,
+        tags: Iterable[str] = (),
+        generation: Optional[int] = None,
+    ) -> None:
+        if generation is not None and generation != self.generation:
+            return
+        if len(body) > self.max_entry_bytes:
+            return
+        self._drop(key)
+        entry = _Entry(body, time.monotonic() + self.ttl, frozenset(tags))
+        self._entries[key] = entry
+        self.size += len(body)
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    def invalidate(self, *tags: str) -> None:
+        self.generation += 1
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._drop(key)
+                self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._tags.clear()
+        self.size = 0
+
+    def report(self) -> dict:
+        lookups = self.stats.hits + self.stats.misses
+        return {
+            **asdict(self.stats),
+            "hit_ratio": round(self.stats.hits / lookups, 4) if lookups else None,
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry.body)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+response_cache = ResponseCache(
+    max_bytes=settings.response_cache_max_bytes,
+    max_entry_bytes=settings.response_cache_max_entry_bytes,
+    ttl=settings.response_cache_ttl,
+)
+
+
+def invalidate_on_commit(db: AsyncSession, *tags: str) -> None:
+    """Сбросить записи с этими тегами, когда транзакция сессии закоммитится."""
+    db.info.setdefault("cache_tags", set()).update(tags)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    tags = session.info.pop("cache_tags", None)
+    if tags:
+        response_cache.invalidate(*tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop("cache_tags", None)
+
+
+async def cached_body(
+    request: Request,
+    key: str,
+    render: Callable[[], Awaitable[Tuple[bytes, Iterable[str]]]],
+) -> Response:
+    """JSON-ответ из кэша или из render(), который отдаёт готовые байты и теги."""
+    # Клиент в окне "читать свои записи" идёт мимо кэша, как и мимо реплики
+    bypass = reads_from_primary(request)
+    body = None if bypass else response_cache.get(key)
+    if body is not None:
+        return JSONBytesResponse(body, headers={"X-Cache": "HIT"})
+
+    generation = response_cache.generation
+    body, tags = await render()
+    if not bypass:
+        response_cache.set(key, body, tags, generation)
+    return JSONBytesResponse(body, headers={"X-Cache": "MISS"})
+
+
+async def cached_json(
+    request: Request,
+    key: str,
+    model: Any,
+    load: Callable[[], Awaitable[Any]],
+    tags: Callable[[Any], Iterable[str]],
+) -> Response:
+    """
+    JSON-ответ из кэша или из load(); model - тип ответа (как response_model),
+    tags получает провалидированные данные и возвращает теги записи.
+    """
+    async def render():
+        type_adapter = adapter(model)
+        data = type_adapter.validate_python(await load(), from_attributes=True)
+        return type_adapter.dump_json(data), tags(data)
+
+    return await cached_body(request, key, render)
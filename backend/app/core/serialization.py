@@ -0,0 +1,57 @@
+"""
+Сериализация больших ответов сразу в байты.
+
+По умолчанию FastAPI проверяет каждый объект через response_model,
+превращает его в dict и кодирует stdlib json. Для списков на тысячи
+строк это основная часть времени ответа, поэтому:
+
+- строки Core (словари колонок) кодируются orjson без pydantic:
+  dump_rows(), для NDJSON - dump_lines();
+- ORM-объекты проходят через заранее собранный TypeAdapter и сразу
+  пишутся в JSON на стороне pydantic-core: dump_models().
+
+Эндпоинт возвращает JSONBytesResponse, и FastAPI его не перепроверяет;
+response_model остаётся только для OpenAPI. Сравнение путей:
+benchmarks/serialization.py.
+"""
+from functools import lru_cache
+from typing import Any, Iterable, Mapping
+
+import orjson
+from fastapi import Response
+from pydantic import TypeAdapter
+
+# Как у pydantic: UTC-время с суффиксом Z
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+
+class JSONBytesResponse(Response):
+    """JSON-ответ из уже готовых байтов."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+@lru_cache(maxsize=None)
+def adapter(model) -> TypeAdapter:
+    """TypeAdapter собирается один раз на тип ответа."""
+    return TypeAdapter(model)
+
+
+def dump_models(model: Any, data: Any) -> bytes:
+    """ORM-объекты или словари -> JSON по схеме model (как response_model)."""
+    type_adapter = adapter(model)
+    return type_adapter.dump_json(type_adapter.validate_python(data, from_attributes=True))
+
+
+def dump_rows(rows: Iterable[Mapping[str, Any]]) -> bytes:
+    """Словари с ключами в порядке полей схемы -> JSON без pydantic."""
+    return orjson.dumps(rows if isinstance(rows, list) else list(rows), option=ORJSON_OPTIONS)
+
+
+def dump_lines(rows: Iterable[Mapping[str, Any]]) -> bytes:
+    """То же, что dump_rows, но NDJSON: объект на строку."""
+    return b"".join(orjson.dumps(row, option=ORJSON_OPTIONS) + b"\n" for row in rows)
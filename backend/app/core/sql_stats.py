@@ -0,0 +1,148 @@
+"""
+Счётчики SQL-запросов в рамках одного HTTP-запроса.
+
+Слушатели событий движка складывают количество выражений, время в БД и
+число строк в QueryStats текущего запроса; QueryStatsMiddleware отдаёт их
+клиенту в заголовке Server-Timing. query_budget и assert_query_budget
+используются в тестах, чтобы ловить N+1 до продакшена.
+"""
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+
+
+@dataclass
+class QueryStats:
+    statements: int = 0
+    db_time: float = 0.0  # секунды
+    rows: int = 0
+    # Текст выражений нужен только отчёту query_budget; на каждом
+    # HTTP-запросе его не копим
+    record_queries: bool = False
+    queries: List[str] = field(default_factory=list)
+
+    def server_timing(self) -> str:
+        return (
+            f"db;dur={self.db_time * 1000:.2f}, "
+            f'db-stmt;desc="{self.statements}", '
+            f'db-rows;desc="{self.rows}"'
+        )
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("sql_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+def instrument_engine(engine) -> None:
+    """Подключает счётчики к движку (AsyncEngine или обычному Engine)."""
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        stats = _current_stats.get()
+        if stats is None:
+            return
+        stats.statements += 1
+        stats.db_time += time.perf_counter() - started
+        if stats.record_queries:
+            stats.queries.append(statement)
+        # rowcount драйвера: для SELECT у буферизованных курсоров - число строк
+        if cursor.rowcount and cursor.rowcount > 0:
+            stats.rows += cursor.rowcount
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(context):
+        # after_cursor_execute при ошибке не вызывается: иначе отметка упавшего
+        # выражения осталась бы в conn.info до конца жизни соединения
+        if context.connection is not None:
+            starts = context.connection.info.get("query_start")
+            if starts:
+                starts.pop()
+
+
+class QueryStatsMiddleware:
+    """Заводит QueryStats на каждый HTTP-запрос и пишет Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_statements: int):
+    """
+    Падает, если код внутри блока выполнил больше max_statements выражений.
+
+        async with db_helper.session_factory() as db:
+            with query_budget(3):
+                await BooksFondsService(db, ...).get_filtered_books(...)
+    """
+    stats = QueryStats(record_queries=True)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+    if stats.statements > max_statements:
+        raise QueryBudgetExceeded(
+            f"{stats.statements} SQL statements, budget is {max_statements}:\n"
+            + "\n".join(stats.queries)
+        )
+
+
+_STMT_RE = re.compile(r'db-stmt;desc="(\d+)"')
+
+
+def assert_query_budget(response, max_statements: int) -> int:
+    """
+    Проверяет ответ маршрута (TestClient/httpx) по заголовку Server-Timing.
+    Возвращает фактическое число выражений.
+    """
+    header = response.headers.get("server-timing", "")
+    match = _STMT_RE.search(header)
+    if not match:
+        raise AssertionError("Server-Timing header has no db-stmt metric")
+    statements = int(match.group(1))
+    if statements > max_statements:
+        raise QueryBudgetExceeded(
+            f"{response.request.method} {response.request.url.path}: "
+            f"{statements} SQL statements, budget is {max_statements}"
+        )
+    return statements
@@ -1,12 +1,18 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request
 from fastapi.staticfiles import StaticFiles
 import os
+from typing import Optional
 from fastapi.responses import FileResponse
 from contextlib import asynccontextmanager
-from .core import BASE_DIR, MEDIA_DIR
+from .core import BASE_DIR, MEDIA_DIR, MAX_FILE_SIZE
 from .core.middleware import setup_middleware
 from .core.database import db_helper, get_db
+from .core import media
+from .core.images import derivative_pool
+from .core.passwords import password_hasher
 from .models import Base
+from .api.v2.books.services import BooksFondsService
+from .api.v2.books.jobs import import_jobs
 
 
 @asynccontextmanager
@@ -16,9 +22,18 @@ async def lifespan(app: FastAPI):
         await conn.run_sync(Base.metadata.create_all)
         print("Database tables created or already exist")
 
+    # Индексы автодополнения авторов и жанров
+    async with db_helper.session_factory() as db:
+        await BooksFondsService(db, MEDIA_DIR, MAX_FILE_SIZE).build_name_indexes()
+
     yield  # Здесь приложение работает
 
-    # Закрываем соединения при завершении
+    # Дожидаемся фонового удаления файлов, закрываем соединения и пулы
+    # изображений, bcrypt и импорта при завершении
+    await media.wait_cleanup()
+    await derivative_pool.close()
+    password_hasher.close()
+    import_jobs.close()
     await db_helper.close()
     print("Database connections closed")
 
@@ -31,11 +46,12 @@ setup_middleware(app)
 
 # Подключаем папку static
 @app.get("/picture/{filename}")
-def get_photo(filename: str):
-    path = os.path.join(MEDIA_DIR, filename)
-    if not os.path.isfile(path):
-        return JSONResponse(status_code=404, content={"detail": "File not found"})
-    return FileResponse(path)
+async def get_photo(
+    request: Request,
+    filename: str,
+    w: Optional[int] = Query(None, ge=1, description="Нужная ширина; отдаётся ближайшая копия не уже неё"),
+):
+    return await media.serve(request, filename, w)
 
 
 
@@ -8,6 +8,7 @@ __all__ = (
   "Section",
   "User",
   "UserRole",
+  "ExhibitionSnapshot",
 )
 
 from .base_model import Base
@@ -16,6 +17,7 @@ from .sections import Section
 from .contentblocks import ContentBlock 
 from .books import Book, Author, Genre
 from .users import User, UserRole
+from .snapshots import ExhibitionSnapshot
 
 from sqlalchemy.orm import relationship, configure_mappers
 configure_mappers()
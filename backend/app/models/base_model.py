@@ -1,5 +1,6 @@
-from sqlalchemy import Integer
+from sqlalchemy import Integer, Column, DateTime, text
 from sqlalchemy.orm import Mapped, DeclarativeBase, mapped_column, declared_attr
+from sqlalchemy.sql import func
 
 
 class Base(DeclarativeBase):
@@ -10,3 +11,18 @@ class Base(DeclarativeBase):
         return f"{cls.__name__.lower()}s"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+
+
+class VersionedMixin:
+    """
+    Версия строки и время изменения для ETag / Last-Modified.
+    Растут при каждом UPDATE строки, в том числе из Core update().
+    """
+    version = Column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default=text("1"),
+        onupdate=text("version + 1"),
+    )
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
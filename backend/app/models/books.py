@@ -4,10 +4,12 @@ from sqlalchemy import (
     Integer,
     Table,
     ForeignKey,
-    String
+    String,
+    Index,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
-from .base_model import Base
+from .base_model import Base, VersionedMixin
 
 book_authors = Table(
   "book_authors",
@@ -23,52 +25,77 @@ book_genres = Table(
   Column("genre_id", Integer, ForeignKey("genres.id", ondelete="CASCADE"))
 )
 
-class Book(Base):
+class Book(VersionedMixin, Base):
     title = Column(Text, nullable=False)
     annotations = Column(Text)
     library_description = Column(Text)
     image_url = Column(Text)
     year_of_publication = Column(Text)
+    # Инвентарный номер из импорта; по нему потом привязываются обложки
+    external_id = Column(String(64), nullable=True)
     # Связь
     authors = relationship(
       "Author",
       secondary=book_authors,
       back_populates="books", 
       passive_deletes=True,
-      lazy="selectin",
+      lazy="raise_on_sql",
     )
     genres = relationship(
       "Genre",
       secondary=book_genres,
       back_populates="books",
       passive_deletes=True,
-      lazy="selectin",
+      lazy="raise_on_sql",
     )
     content_blocks = relationship(
       "ContentBlock",
       back_populates="book",
       cascade="all, delete-orphan",
       passive_deletes=True,
+      lazy="raise_on_sql",
+    )
+
+    __table_args__ = (
+        # Полнотекстовый поиск; ngram-парсер режет кириллицу на биграммы
+        Index(
+            "ix_books_fulltext",
+            "title", "annotations", "library_description",
+            mysql_prefix="FULLTEXT",
+            mysql_with_parser="ngram",
+        ).ddl_if(dialect="mysql"),
+        # Подсчёт ссылок на файл изображения (core/media.py)
+        Index("ix_books_image_url", "image_url", mysql_length=100),
+        UniqueConstraint("external_id", name="uq_books_external_id"),
     )
   
 
-class Author(Base):
+class Author(VersionedMixin, Base):
   name = Column(Text)
   books = relationship(
     "Book",
     secondary=book_authors,
     back_populates="authors",
     passive_deletes=True,
-    lazy="selectin"
+    lazy="raise_on_sql"
+  )
+
+  __table_args__ = (
+    Index(
+      "ix_authors_name_fulltext",
+      "name",
+      mysql_prefix="FULLTEXT",
+      mysql_with_parser="ngram",
+    ).ddl_if(dialect="mysql"),
   )
   
 
-class Genre(Base):  
+class Genre(VersionedMixin, Base):  
     name = Column(String(255), unique=True)  
     books = relationship(
         "Book",
         secondary=book_genres,
         back_populates="genres",
         passive_deletes=True,
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
\ No newline at end of file
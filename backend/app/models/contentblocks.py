@@ -21,10 +21,11 @@ class ContentBlock(Base):
     text_content = Column(Text)
     # Связи
     section_id = Column(Integer, ForeignKey("sections.id", ondelete="CASCADE"))
-    book_id = Column(Integer, ForeignKey("books.id"))
+    # Блок книги без книги не имеет смысла: удаляется вместе с ней
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"))
 
-    section = relationship("Section", back_populates="content_blocks")
-    book = relationship("Book", back_populates="content_blocks", lazy="selectin")
+    section = relationship("Section", back_populates="content_blocks", lazy="raise_on_sql")
+    book = relationship("Book", back_populates="content_blocks", lazy="raise_on_sql")
 
     __table_args__ = (
         CheckConstraint(
@@ -8,16 +8,17 @@ from sqlalchemy import (
     Enum,
     CheckConstraint,
     String,
+    Index,
 )
 import enum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
-from .base_model import Base
+from .base_model import Base, VersionedMixin
 from .books import Book
 
 
-class Exhibition(Base):
+class Exhibition(VersionedMixin, Base):
     title = Column(Text, nullable=False)
     slug = Column(String(255), unique=True, index=True, nullable=False)
     is_published = Column(Boolean, default=True)
@@ -30,16 +31,18 @@ class Exhibition(Base):
     ForeignKey('users.id', ondelete="SET NULL"),  # ← сюда ondelete
     nullable=True
 )
-    author = relationship("User", back_populates="exhibitions")
+    author = relationship("User", back_populates="exhibitions", lazy="raise_on_sql")
     sections = relationship(
         "Section",
         back_populates="exhibitions",
-        lazy="selectin",
+        lazy="raise_on_sql",
         cascade="all, delete-orphan",
         passive_deletes=True,
     )
 
-
-
-
-
+    __table_args__ = (
+        # Keyset-пагинация: ORDER BY published_at DESC, id DESC
+        Index("ix_exhibitions_published_at_id", "published_at", "id"),
+        # Подсчёт ссылок на файл изображения (core/media.py)
+        Index("ix_exhibitions_image", "image", mysql_length=100),
+    )
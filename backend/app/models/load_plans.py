@@ -0,0 +1,59 @@
+"""
+Именованные планы загрузки связей.
+
+Все связи моделей объявлены с lazy="raise_on_sql": неявная ленивая
+загрузка запрещена, и каждый сервис явно применяет план, который
+загружает ровно то, что сериализует эндпоинт:
+
+    select(Book).options(*BOOK_CARD)
+"""
+from sqlalchemy.orm import selectinload, load_only, noload
+
+from .books import Book, Author, Genre
+from .contentblocks import ContentBlock
+from .exhibitions import Exhibition
+from .sections import Section
+
+
+# Книга с авторами и жанрами (BookResponse)
+BOOK_CARD = (
+    selectinload(Book.authors).load_only(Author.id, Author.name),
+    selectinload(Book.genres).load_only(Genre.id, Genre.name),
+)
+
+# Пары id/name для выпадающих списков (AuthorResponse, GenreResponse)
+AUTHOR_OPTION = (load_only(Author.id, Author.name),)
+GENRE_OPTION = (load_only(Genre.id, Genre.name),)
+
+# Блок контента с книгой (ContentBlockResponse)
+CONTENT_BLOCK = (
+    selectinload(ContentBlock.book).options(*BOOK_CARD),
+)
+
+# Раздел с блоками контента (SectionResponse)
+SECTION_TREE = (
+    selectinload(Section.content_blocks).options(*CONTENT_BLOCK),
+)
+
+# Выставка без дерева разделов: для проверок и карточек в списках
+EXHIBITION_HEADER = (
+    selectinload(Exhibition.author),
+    noload(Exhibition.sections),
+)
+
+# Полная выставка: разделы -> блоки -> книги -> авторы/жанры (ExhibitionOut)
+EXHIBITION_TREE = (
+    selectinload(Exhibition.author),
+    selectinload(Exhibition.sections).options(*SECTION_TREE),
+)
+
+
+LOAD_PLANS = {
+    "BOOK_CARD": BOOK_CARD,
+    "AUTHOR_OPTION": AUTHOR_OPTION,
+    "GENRE_OPTION": GENRE_OPTION,
+    "CONTENT_BLOCK": CONTENT_BLOCK,
+    "SECTION_TREE": SECTION_TREE,
+    "EXHIBITION_HEADER": EXHIBITION_HEADER,
+    "EXHIBITION_TREE": EXHIBITION_TREE,
+}
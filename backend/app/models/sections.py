@@ -17,11 +17,12 @@ class Section(Base):
     exhibitions = relationship(
         "Exhibition",
         back_populates="sections",
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
     content_blocks = relationship(
         "ContentBlock",
         back_populates="section",
-        lazy="selectin",
+        lazy="raise_on_sql",
         cascade="all, delete-orphan",
+        passive_deletes=True,
     )
@@ -0,0 +1,24 @@
+from sqlalchemy import (
+    ForeignKey,
+    Text,
+    Column,
+    Integer,
+    DateTime,
+)
+from sqlalchemy.dialects import mysql
+from sqlalchemy.sql import func
+
+from .base_model import Base
+
+
+class ExhibitionSnapshot(Base):
+    """Готовый JSON страницы опубликованной выставки (ExhibitionPage)."""
+    exhibition_id = Column(
+        Integer,
+        ForeignKey("exhibitions.id", ondelete="CASCADE"),
+        unique=True,
+        nullable=False,
+    )
+    # TEXT в MySQL ограничен 64 КБ, документ большой выставки больше
+    document = Column(Text().with_variant(mysql.LONGTEXT(), "mysql"), nullable=False)
+    built_at = Column(DateTime, server_default=func.now())
@@ -17,4 +17,4 @@ class User(Base):
     fullname = Column(String(100), nullable=True)
     hashed_password = Column(String(255), nullable=False)
     role = Column(Enum(UserRole), nullable=False)
-    exhibitions = relationship("Exhibition", back_populates="author")
\ No newline at end of file
+    exhibitions = relationship("Exhibition", back_populates="author", lazy="raise_on_sql")
\ No newline at end of file
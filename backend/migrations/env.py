@@ -19,8 +19,8 @@ if config.config_file_name is not None:
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
-from ..app.core import Base
-from ..app.core import settings
+from app.models import Base
+from app.core import settings
 
 target_metadata = Base.metadata
 
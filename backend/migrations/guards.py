@@ -0,0 +1,31 @@
+"""
+Проверки схемы для ревизий.
+
+Таблицы создаёт и create_all при старте приложения, поэтому часть того,
+что добавляют ревизии, в базе уже может быть. Ревизии создают только
+недостающее и одинаково проходят на базе от create_all и на базе,
+обновлённой предыдущими ревизиями.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+def has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def has_index(table: str, name: str) -> bool:
+    """Индекс или уникальное ограничение с этим именем."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return False
+    names = {index["name"] for index in inspector.get_indexes(table)}
+    names |= {constraint["name"] for constraint in inspector.get_unique_constraints(table)}
+    return name in names
+
+
+def has_column(table: str, column: str) -> bool:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return False
+    return column in {item["name"] for item in inspector.get_columns(table)}
@@ -0,0 +1,36 @@
+"""exhibitions keyset index
+
+Revision ID: 3f1c2a7b9d10
+Revises: 
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.guards import has_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a7b9d10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # На базе от create_all индекс уже есть (Exhibition.__table_args__)
+    if has_index('exhibitions', 'ix_exhibitions_published_at_id'):
+        return
+    op.create_index(
+        'ix_exhibitions_published_at_id',
+        'exhibitions',
+        ['published_at', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_exhibitions_published_at_id', table_name='exhibitions')
@@ -0,0 +1,49 @@
+"""books fulltext ngram
+
+Revision ID: 8a4d6e2c1b57
+Revises: 3f1c2a7b9d10
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.guards import has_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4d6e2c1b57'
+down_revision: Union[str, None] = '3f1c2a7b9d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # FULLTEXT WITH PARSER ngram есть только в MySQL
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    if not has_index('books', 'ix_books_fulltext'):
+        op.create_index(
+            'ix_books_fulltext',
+            'books',
+            ['title', 'annotations', 'library_description'],
+            mysql_prefix='FULLTEXT',
+            mysql_with_parser='ngram',
+        )
+    if not has_index('authors', 'ix_authors_name_fulltext'):
+        op.create_index(
+            'ix_authors_name_fulltext',
+            'authors',
+            ['name'],
+            mysql_prefix='FULLTEXT',
+            mysql_with_parser='ngram',
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    op.drop_index('ix_authors_name_fulltext', table_name='authors')
+    op.drop_index('ix_books_fulltext', table_name='books')
@@ -0,0 +1,46 @@
+"""exhibition snapshots
+
+Revision ID: c52e9b0d7f31
+Revises: 8a4d6e2c1b57
+Create Date: 2026-10-18 14:00:00.000000
+
+После применения заполнить снимки: python -m app.cli rebuild-snapshots
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+from migrations.guards import has_table
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52e9b0d7f31'
+down_revision: Union[str, None] = '8a4d6e2c1b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all при старте приложения мог создать таблицу раньше миграции
+    if has_table('exhibitionsnapshots'):
+        return
+    op.create_table(
+        'exhibitionsnapshots',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('exhibition_id', sa.Integer(), nullable=False),
+        sa.Column(
+            'document',
+            sa.Text().with_variant(mysql.LONGTEXT(), 'mysql'),
+            nullable=False,
+        ),
+        sa.Column('built_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['exhibition_id'], ['exhibitions.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('exhibition_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('exhibitionsnapshots')
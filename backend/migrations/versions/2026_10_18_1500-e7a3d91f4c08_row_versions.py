@@ -0,0 +1,42 @@
+"""row versions for etags
+
+Revision ID: e7a3d91f4c08
+Revises: c52e9b0d7f31
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.guards import has_column
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3d91f4c08'
+down_revision: Union[str, None] = 'c52e9b0d7f31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('exhibitions', 'books', 'authors', 'genres')
+
+
+def upgrade() -> None:
+    for table in TABLES:
+        if not has_column(table, 'version'):
+            op.add_column(
+                table,
+                sa.Column('version', sa.Integer(), server_default=sa.text('1'), nullable=False),
+            )
+        if not has_column(table, 'updated_at'):
+            op.add_column(
+                table,
+                sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+            )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,33 @@
+"""media reference indexes
+
+Revision ID: 5b8f0c2e6a94
+Revises: e7a3d91f4c08
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.guards import has_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8f0c2e6a94'
+down_revision: Union[str, None] = 'e7a3d91f4c08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # TEXT в MySQL индексируется только по префиксу
+    if not has_index('books', 'ix_books_image_url'):
+        op.create_index('ix_books_image_url', 'books', ['image_url'], mysql_length=100)
+    if not has_index('exhibitions', 'ix_exhibitions_image'):
+        op.create_index('ix_exhibitions_image', 'exhibitions', ['image'], mysql_length=100)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_exhibitions_image', table_name='exhibitions')
+    op.drop_index('ix_books_image_url', table_name='books')
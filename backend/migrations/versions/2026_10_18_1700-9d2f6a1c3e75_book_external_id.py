@@ -0,0 +1,32 @@
+"""book external id
+
+Revision ID: 9d2f6a1c3e75
+Revises: 5b8f0c2e6a94
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.guards import has_column, has_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2f6a1c3e75'
+down_revision: Union[str, None] = '5b8f0c2e6a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if not has_column('books', 'external_id'):
+        op.add_column('books', sa.Column('external_id', sa.String(length=64), nullable=True))
+    if not has_index('books', 'uq_books_external_id'):
+        op.create_unique_constraint('uq_books_external_id', 'books', ['external_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_books_external_id', 'books', type_='unique')
+    op.drop_column('books', 'external_id')
@@ -0,0 +1,43 @@
+"""content block book cascade
+
+Revision ID: 4e6b2d8a1f93
+Revises: 9d2f6a1c3e75
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e6b2d8a1f93'
+down_revision: Union[str, None] = '9d2f6a1c3e75'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FK_NAME = 'fk_contentblocks_book_id_books'
+
+
+def _book_fk() -> dict:
+    # Таблицу создавал create_all: имя внешнего ключа выбрала СУБД (contentblocks_ibfk_N)
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('contentblocks'):
+        if fk['referred_table'] == 'books' and fk['constrained_columns'] == ['book_id']:
+            return fk
+    raise RuntimeError('contentblocks.book_id foreign key not found')
+
+
+def upgrade() -> None:
+    fk = _book_fk()
+    # create_all по текущим моделям уже создал ключ с ON DELETE CASCADE
+    if (fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE':
+        return
+    op.drop_constraint(fk['name'], 'contentblocks', type_='foreignkey')
+    op.create_foreign_key(FK_NAME, 'contentblocks', 'books', ['book_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    # Если ключ создал create_all, upgrade его не трогал: имя выбрала СУБД
+    op.drop_constraint(_book_fk()['name'], 'contentblocks', type_='foreignkey')
+    op.create_foreign_key(FK_NAME, 'contentblocks', 'books', ['book_id'], ['id'])